@@ -5,27 +5,48 @@ from fastapi import FastAPI, Request
 from fastapi.openapi.utils import get_openapi
 from fastapi.responses import JSONResponse, RedirectResponse
 from sentry_sdk.integrations.asgi import SentryAsgiMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette_prometheus import PrometheusMiddleware, metrics
+from starlette_prometheus import metrics
 
 from app.exceptions.errors import (BadImage, BadUrl, FileLarge,
-                                   ManipulationError, NoImageFound,
-                                   ParameterError, RateLimit, ServerTimeout,
-                                   Unauthorised)
-from app.middleware import add_process_time_header, auth_check
-from app.routes import image_routes
+                                   ManipulationError, ManipulationTimeout,
+                                   NoImageFound, ParameterError, RateLimit,
+                                   ServerBusy, ServerTimeout,
+                                   SourceUnavailable, Unauthorised)
+from app.image.asset_registry import assets
+from app.image.decorators import shutdown_executors, start_executors
+from app.middleware import (AuthMiddleware, ProcessTimeMiddleware,
+                            PrometheusMiddleware)
+from app.routes import batch_routes, image_routes
+from app.utils.client import close_clients, open_clients
+from app.utils.stats import stat_buffer
 
 sentry = os.getenv("SENTRY")
 sentry_sdk.init(dsn=sentry, release="dagpi-image@1.2.0")
 app = FastAPI(docs_url="/playground", redoc_url="/docs")
 asgi_app = SentryAsgiMiddleware(app)
 app.add_middleware(PrometheusMiddleware)
-app.add_middleware(BaseHTTPMiddleware, dispatch=add_process_time_header)
+app.add_middleware(ProcessTimeMiddleware)
 app.include_router(image_routes.router)
-app.add_middleware(BaseHTTPMiddleware, dispatch=auth_check)
+app.include_router(batch_routes.router)
+app.add_middleware(AuthMiddleware)
 app.add_route("/metrics/", metrics)
 
 
+@app.on_event("startup")
+async def startup():
+    open_clients()
+    assets.preload()
+    start_executors()
+    stat_buffer.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await stat_buffer.stop()
+    await close_clients()
+    shutdown_executors()
+
+
 @app.exception_handler(NoImageFound)
 async def no_image_found(_request: Request, _exc: NoImageFound):
     return JSONResponse(
@@ -53,6 +74,14 @@ async def manipulation_error(_request: Request, exc: ManipulationError):
     )
 
 
+@app.exception_handler(ManipulationTimeout)
+async def manipulation_timeout(_request: Request, _exc: ManipulationTimeout):
+    return JSONResponse(
+        status_code=504,
+        content={"message": "Image took too long to be processed"},
+    )
+
+
 @app.exception_handler(FileLarge)
 async def size_error(_request: Request, _exc: FileLarge):
     return JSONResponse(
@@ -95,6 +124,24 @@ async def rate_error(_request: Request, _exc: RateLimit):
     )
 
 
+@app.exception_handler(ServerBusy)
+async def busy_error(_request: Request, _exc: ServerBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"message": "Server is busy, try again later"},
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.exception_handler(SourceUnavailable)
+async def source_unavailable(_request: Request, _exc: SourceUnavailable):
+    return JSONResponse(
+        status_code=503,
+        content={"message": "The image host is failing, try again later"},
+        headers={"Retry-After": "30"},
+    )
+
+
 @app.exception_handler(500)
 async def internal_server_error(req, exc):
     e_str = str(exc)
@@ -147,12 +194,13 @@ def custom_openapi():
         "x-logo": {
             "url": "https://asyncdagpi.readthedocs.io/en/latest/_static/"
                    "dagpib.png"}}
-    for endpoint in openapi_schema["paths"].keys():
+    for endpoint, operations in openapi_schema["paths"].items():
         if endpoint not in ["/", "/image/openapi.json"]:
-            openapi_schema["paths"][endpoint]["get"]["parameters"].append(
-                {"required": True,
-                 "schema": {"title": "Authorization", "type": "string"},
-                 "name": "Authorization", "in": "header"})
+            for operation in operations.values():
+                operation.setdefault("parameters", []).append(
+                    {"required": True,
+                     "schema": {"title": "Authorization", "type": "string"},
+                     "name": "Authorization", "in": "header"})
     app.openapi_schema = openapi_schema
     return app.openapi_schema
 
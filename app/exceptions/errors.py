@@ -41,3 +41,15 @@ class ManipulationError(DagpiException):
 
 class ParameterError(DagpiException):
     pass
+
+
+class ServerBusy(DagpiException):
+    pass
+
+
+class ManipulationTimeout(DagpiException):
+    pass
+
+
+class SourceUnavailable(DagpiException):
+    pass
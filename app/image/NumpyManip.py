@@ -36,4 +36,5 @@ def numpy(function):
         ret_img = function(img, *args, **kwargs)
         return NumpyManip.image_save(ret_img)
 
+    wrapper.backend = "numpy"
     return wrapper
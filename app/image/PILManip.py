@@ -2,33 +2,56 @@ import functools
 from io import BytesIO
 from typing import List
 
-from PIL import Image, ImageSequence, UnidentifiedImageError
+from PIL import Image, UnidentifiedImageError
 
 from app.exceptions.errors import BadImage, FileLarge
+from app.image.decode_budget import OVERSIZE_POLICIES, plan_decode
+from app.image.decorators import frame_pool
+from app.image.gif_encoder import encode_gif
 
 
 class PILManip:
     @staticmethod
-    def pil_image(image: bytes) -> Image:
+    def pil_image(image: bytes, size=None) -> Image:
         if image.__sizeof__() > 10 * (2 ** 20):
             raise FileLarge("Exceeds 10MB")
         try:
             io = BytesIO(image)
             io.seek(0)
-            return Image.open(io, formats=("PNG", "JPEG", "GIF"))
+            img = Image.open(io, formats=("PNG", "JPEG", "GIF"))
         except UnidentifiedImageError:
             raise BadImage("Unable to use Image")
+        return PILManip.shrink_to(img, size)
 
     @staticmethod
-    def static_pil_image(image: bytes) -> Image:
+    def static_pil_image(image: bytes, size=None) -> Image:
         if image.__sizeof__() > 15 * (2 ** 20):
             raise FileLarge("File Exceeds 15 Mb")
         try:
             io = BytesIO(image)
             io.seek(0)
-            return Image.open(io, formats=("PNG", "JPEG"))
+            img = Image.open(io, formats=("PNG", "JPEG"))
         except UnidentifiedImageError:
             raise BadImage("Unable to use Image")
+        return PILManip.shrink_to(img, size)
+
+    @staticmethod
+    def shrink_to(img: Image, size=None) -> Image:
+        """Decode a still image at the smallest scale that is still at
+        least ``size``, for callers that only use a thumbnail of it.
+
+        JPEGs are drafted so the decoder itself works at 1/2, 1/4 or 1/8
+        scale. Other formats are reduced by a whole factor once decoded.
+        """
+        if size is None or img.format not in ("PNG", "JPEG"):
+            return img
+        if img.format == "JPEG":
+            img.draft(img.mode, size)
+            return img
+        factor = min(img.width // size[0], img.height // size[1])
+        if factor < 2 or img.mode in ("P", "1"):
+            return img
+        return img.reduce(factor)
 
     @staticmethod
     def pil_image_save(img: Image) -> BytesIO:
@@ -38,51 +61,83 @@ class PILManip:
         return image_bytes
 
     @staticmethod
-    def pil_gif_save(frames: List) -> BytesIO:
-        image_bytes = BytesIO()
-        frames[0].save(image_bytes,
-                       format="gif",
-                       save_all=True,
-                       loop=0,
-                       append_images=frames)
-        image_bytes.seek(0)
-        return image_bytes
+    def pil_gif_save(frames: List, duration=None, loop: int = 0,
+                     palette: str = None) -> BytesIO:
+        return encode_gif(frames, duration=duration, loop=loop,
+                          palette=palette)
+
 
+def pil(function=None, *, oversize: str = "downscale", size=None):
+    """Run a manipulation over a still image or every frame of a GIF.
+
+    Inputs over the decode budget are handled by the ``oversize`` policy,
+    see :func:`plan_decode`. ``size`` is the smallest size the
+    manipulation needs a still image at, see :meth:`PILManip.shrink_to`.
+    """
+    if function is None:
+        return functools.partial(pil, oversize=oversize, size=size)
+    if oversize not in OVERSIZE_POLICIES:
+        raise ValueError(f"Unknown oversize policy {oversize}")
 
-def pil(function):
     @functools.wraps(function)
     def wrapper(image, *args, **kwargs) -> BytesIO:
+        plan = plan_decode(image, oversize)
         img = PILManip.pil_image(image)
         if img.format == "GIF":
-            frames = []
-            for frame in ImageSequence.Iterator(img):
-                res_frame = function(frame, *args, **kwargs)
-                frames.append(res_frame)
-            return PILManip.pil_gif_save(frames), "gif"
+            durations = []
+            frames = list(frame_pool.map(function,
+                                         plan.frames_of(img, durations),
+                                         *args, **kwargs))
+            io = PILManip.pil_gif_save(frames, durations,
+                                       img.info.get("loop", 0))
+            image_format = "gif"
         elif img.format in ["PNG", "JPEG"]:
+            img = plan.prepare(PILManip.shrink_to(img, size))
+            # the size hint can leave it smaller than the budget needs
+            plan.size = img.size
             img = function(img, *args, **kwargs)
-            return PILManip.pil_image_save(img), "png"
+            io = PILManip.pil_image_save(img)
+            image_format = "png"
         else:
             raise BadImage("Bad Format")
+        io.processing_size = plan.processing_size
+        return io, image_format
 
+    wrapper.backend = "pil"
+    wrapper.oversize = oversize
+    wrapper.size = size
     return wrapper
 
 
-def double_image(function):
-    @functools.wraps(function)
-    def wrapper(image_a, image_b, *args, **kwargs) -> BytesIO:
-        image_a = PILManip.static_pil_image(image_a)
-        image_b = PILManip.static_pil_image(image_b)
-        img = function(image_a, image_b, *args, **kwargs)
-        return PILManip.pil_image_save(img)
+def multi_image(count: int, *, size=None):
+    """Open the first ``count`` arguments as still images, for templates
+    that combine several sources."""
+
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs) -> BytesIO:
+            images = [PILManip.static_pil_image(image, size)
+                      for image in args[:count]]
+            img = function(*images, *args[count:], **kwargs)
+            return PILManip.pil_image_save(img)
+
+        return wrapper
+
+    return decorate
+
+
+def double_image(function=None, *, size=None):
+    decorate = multi_image(2, size=size)
+    return decorate if function is None else decorate(function)
 
-    return wrapper
 
+def static_pil(function=None, *, size=None):
+    if function is None:
+        return functools.partial(static_pil, size=size)
 
-def static_pil(function):
     @functools.wraps(function)
     def wrapper(image, *args, **kwargs) -> BytesIO:
-        img = PILManip.static_pil_image(image)
+        img = PILManip.static_pil_image(image, size)
         img = function(img, *args, **kwargs)
         return PILManip.pil_image_save(img)
 
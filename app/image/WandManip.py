@@ -5,6 +5,8 @@ from wand.exceptions import TypeError
 from wand.image import Image
 
 from app.exceptions.errors import BadImage, FileLarge
+from app.image.decode_budget import OVERSIZE_POLICIES, plan_decode, shrink
+from app.image.decorators import frame_pool
 
 
 class WandManip:
@@ -24,21 +26,57 @@ class WandManip:
         return io
 
 
-def wand(function):
+def consume_frame(function, frame: Image, *args, **kwargs) -> Image:
+    """``function(frame, *args, **kwargs)``, closing ``frame`` unless it
+    is the image returned."""
+    result = None
+    try:
+        result = function(frame, *args, **kwargs)
+        return result
+    finally:
+        if result is not frame:
+            frame.close()
+
+
+def wand(function=None, *, oversize: str = "downscale"):
+    """Run a manipulation over a still image or every frame of a GIF.
+
+    ImageMagick decodes every frame up front, so inputs over the decode
+    budget are reduced with Pillow, which decodes one frame at a time,
+    before they reach it.
+    """
+    if function is None:
+        return functools.partial(wand, oversize=oversize)
+    if oversize not in OVERSIZE_POLICIES:
+        raise ValueError(f"Unknown oversize policy {oversize}")
+
     @functools.wraps(function)
     def wrapper(image, *args, **kwargs):
+        plan = plan_decode(image, oversize)
+        if plan.reduced:
+            image = shrink(image, plan)
         img = WandManip.wand_open(image)
         if img.format == "GIF":
+            # each frame is cloned into an image of its own, keeping its
+            # delay, disposal and offset, so frames can be worked on at once
+            frames = (Image(image=frame) for frame in img.sequence)
             with Image() as dst_image:
-                for frame in img.sequence:
-                    frame = function(frame, *args, **kwargs)
-                    dst_image.sequence.append(frame)
+                for frame in frame_pool.map(
+                        functools.partial(consume_frame, function), frames,
+                        *args, **kwargs):
+                    with frame:
+                        dst_image.sequence.append(frame)
+                dst_image.loop = img.loop
                 byt = dst_image.make_blob()
         elif img.format in ["PNG", "JPEG"]:
             dst_image = function(img, *args, **kwargs)
             byt = dst_image.make_blob()
         else:
             raise BadImage("Inavlid Format")
-        return WandManip.wand_save(byt), img.format
+        io = WandManip.wand_save(byt)
+        io.processing_size = plan.processing_size
+        return io, img.format
 
+    wrapper.backend = "wand"
+    wrapper.oversize = oversize
     return wrapper
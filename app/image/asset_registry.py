@@ -0,0 +1,97 @@
+import logging
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+from PIL import Image, ImageSequence
+
+ASSET_DIR = "app/image/assets"
+
+logger = logging.getLogger(__name__)
+
+
+class AssetSpec:
+
+    def __init__(self, filename: str, mode: Optional[str],
+                 size: Optional[Tuple[int, int]], resample: int,
+                 frames: bool):
+        self.filename = filename
+        self.mode = mode
+        self.size = size
+        self.resample = resample
+        self.frames = frames
+
+    def prepare(self, img: Image) -> Image:
+        if self.mode is not None and img.mode != self.mode:
+            img = img.convert(self.mode)
+        if self.size is not None:
+            img = img.resize(self.size, self.resample)
+        elif self.frames:
+            # the sequence iterator reuses one image for every frame
+            img = img.copy()
+        return img
+
+
+def _image_bytes(img: Image) -> int:
+    return img.width * img.height * len(img.getbands())
+
+
+class AssetRegistry:
+    """Template images decoded once and shared by every request.
+
+    Each template is registered with the conversion and resize its
+    handler needs, so that work also happens only once. ``get`` returns
+    a copy that can be pasted onto or drawn over freely, ``shared``
+    returns the registry's own image, which must only be read.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._specs: Dict[str, AssetSpec] = {}
+        self._images: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, key: str, filename: str, mode: Optional[str] = None,
+                 size: Optional[Tuple[int, int]] = None,
+                 resample: int = Image.BICUBIC, frames: bool = False):
+        self._specs[key] = AssetSpec(filename, mode, size, resample, frames)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._specs
+
+    def _decode(self, key: str):
+        spec = self._specs[key]
+        with Image.open(os.path.join(self.directory, spec.filename)) as img:
+            if spec.frames:
+                return tuple(spec.prepare(frame)
+                             for frame in ImageSequence.Iterator(img))
+            img.load()
+            return spec.prepare(img)
+
+    def _load(self, key: str):
+        image = self._images.get(key)
+        if image is None:
+            with self._lock:
+                image = self._images.get(key)
+                if image is None:
+                    image = self._decode(key)
+                    self._images[key] = image
+        return image
+
+    def shared(self, key: str) -> Image:
+        return self._load(key)
+
+    def get(self, key: str) -> Image:
+        return self._load(key).copy()
+
+    def preload(self):
+        size = 0
+        for key in self._specs:
+            image = self._load(key)
+            frames = image if isinstance(image, tuple) else (image,)
+            size += sum(_image_bytes(frame) for frame in frames)
+        logger.debug("Preloaded %d assets using %.1fMB", len(self._specs),
+                     size / 2 ** 20)
+
+
+assets = AssetRegistry(ASSET_DIR)
@@ -0,0 +1,157 @@
+import os
+from io import BytesIO
+from typing import Iterator, List, Tuple
+
+from PIL import Image, ImageSequence, UnidentifiedImageError
+
+from app.exceptions.errors import BadImage, FileLarge
+from app.image.gif_encoder import encode_gif
+
+# frames x width x height an input may decode to before its route's
+# oversize policy applies
+MAX_DECODE_PIXELS = int(os.getenv("MAX_DECODE_PIXELS", 2 ** 26))
+# longer animations keep only every nth frame when they are downscaled
+MAX_DECODE_FRAMES = int(os.getenv("MAX_DECODE_FRAMES", 150))
+OVERSIZE_POLICIES = ("downscale", "reject")
+# the byte cap every backend applies when it opens an input
+MAX_INPUT_BYTES = 10 * (2 ** 20)
+INPUT_FORMATS = ("PNG", "JPEG", "GIF", "WEBP")
+
+
+def _skip_sub_blocks(data: bytes, pos: int) -> int:
+    while pos < len(data):
+        length = data[pos]
+        pos += 1
+        if not length:
+            break
+        pos += length
+    return pos
+
+
+def gif_frame_count(data: bytes) -> int:
+    """Count the images in a GIF by walking its blocks, without decoding
+    any of them."""
+    flags = data[10]
+    pos = 13
+    if flags & 0x80:
+        pos += 3 << ((flags & 7) + 1)
+    frames = 0
+    while pos < len(data):
+        block = data[pos]
+        if block == 0x21:
+            pos = _skip_sub_blocks(data, pos + 2)
+        elif block == 0x2C:
+            frames += 1
+            if pos + 10 > len(data):
+                break
+            flags = data[pos + 9]
+            pos += 10
+            if flags & 0x80:
+                pos += 3 << ((flags & 7) + 1)
+            # the byte after the colour table is the LZW code size
+            pos = _skip_sub_blocks(data, pos + 1)
+        else:
+            break
+    return max(frames, 1)
+
+
+def measure(data: bytes) -> Tuple[int, int, int]:
+    """``(frames, width, height)`` read from an image's headers.
+
+    Only inputs within the byte cap, in one of the formats the backends
+    accept, get as far as Pillow.
+    """
+    if len(data) > MAX_INPUT_BYTES:
+        raise FileLarge("Exceeds 10MB")
+    try:
+        with Image.open(BytesIO(data), formats=INPUT_FORMATS) as img:
+            width, height = img.size
+    except UnidentifiedImageError:
+        raise BadImage("Unable to use Image")
+    frames = gif_frame_count(data) if data[:3] == b"GIF" else 1
+    return frames, width, height
+
+
+class DecodePlan:
+    """The frames of an input to keep and the size to work on them at.
+
+    Every ``step``th frame is kept, and kept frames larger than ``size``
+    are resized to it.
+    """
+
+    def __init__(self, frames: int, source_size: Tuple[int, int], step: int,
+                 size: Tuple[int, int]):
+        self.frames = frames
+        self.source_size = source_size
+        self.step = step
+        self.size = size
+
+    @property
+    def kept(self) -> int:
+        return -(-self.frames // self.step)
+
+    @property
+    def reduced(self) -> bool:
+        return self.step > 1 or self.size != self.source_size
+
+    @property
+    def processing_size(self) -> str:
+        """Working ``WIDTHxHEIGHTxFRAMES``, as sent in X-Processing-Size."""
+        return f"{self.size[0]}x{self.size[1]}x{self.kept}"
+
+    def prepare(self, frame: Image, copy: bool = False) -> Image:
+        if frame.width <= self.size[0] and frame.height <= self.size[1]:
+            return frame.copy() if copy else frame
+        if frame.mode == "P":
+            # palette images would otherwise only resize with NEAREST
+            frame = frame.convert("RGBA")
+        return frame.resize(self.size, Image.BILINEAR)
+
+    def frames_of(self, img: Image, durations: List[int]) -> Iterator[Image]:
+        """Yield the kept frames of an animation at the working size.
+
+        ``durations`` gets one entry per kept frame, which also covers the
+        frames skipped after it, so the animation keeps its timing.
+        """
+        for index, frame in enumerate(ImageSequence.Iterator(img)):
+            duration = frame.info.get("duration", 0)
+            if index % self.step:
+                durations[-1] += duration
+                continue
+            durations.append(duration)
+            # the iterator reuses one image for every frame
+            yield self.prepare(frame, copy=True)
+
+
+def plan_decode(data: bytes, oversize: str = "downscale") -> DecodePlan:
+    """Check an input against the decode budget before it is decoded.
+
+    Inputs over ``MAX_DECODE_PIXELS`` raise :class:`FileLarge` when the
+    route's policy is ``"reject"``. With ``"downscale"`` they are planned
+    down to fit, dropping frames first and then resizing.
+    """
+    frames, width, height = measure(data)
+    if frames * width * height <= MAX_DECODE_PIXELS:
+        return DecodePlan(frames, (width, height), 1, (width, height))
+    if oversize == "reject":
+        raise FileLarge("Image exceeds the decode budget")
+    step = -(-frames // MAX_DECODE_FRAMES)
+    kept = -(-frames // step)
+    scale = min(1.0, (MAX_DECODE_PIXELS / (kept * width * height)) ** 0.5)
+    size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    return DecodePlan(frames, (width, height), step, size)
+
+
+def shrink(data: bytes, plan: DecodePlan) -> bytes:
+    """Re-encode an input reduced as planned, for backends that can only
+    decode a whole file at once."""
+    with Image.open(BytesIO(data), formats=INPUT_FORMATS) as img:
+        if img.format == "GIF":
+            durations = []
+            frames = list(plan.frames_of(img, durations))
+            return encode_gif(frames, duration=durations,
+                              loop=img.info.get("loop", 0),
+                              palette="shared").getvalue()
+        io = BytesIO()
+        plan.prepare(img).save(io, format="png")
+        return io.getvalue()
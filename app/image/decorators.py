@@ -1,18 +1,443 @@
 import asyncio
 import functools
+import importlib
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from collections import deque
 from concurrent import futures
+from typing import Iterable, Iterator
 
-from app.exceptions.errors import ManipulationError
+from prometheus_client import Counter, Gauge, Histogram
 
+from app.exceptions.errors import (ManipulationError, ManipulationTimeout,
+                                   ServerBusy)
+
+POOL_WORKERS = int(os.getenv("MANIPULATION_WORKERS",
+                             min(32, (os.cpu_count() or 1) + 4)))
+POOL_QUEUE_DEPTH = int(os.getenv("MANIPULATION_QUEUE_DEPTH", 64))
+PROCESS_WORKERS = int(os.getenv("PROCESS_WORKERS", os.cpu_count() or 1))
+PROCESS_QUEUE_DEPTH = int(os.getenv("PROCESS_QUEUE_DEPTH", 32))
+PROCESS_TASK_TIMEOUT = float(os.getenv("PROCESS_TASK_TIMEOUT", 30))
+PROCESS_MAX_TASKS_PER_CHILD = int(os.getenv("PROCESS_MAX_TASKS_PER_CHILD",
+                                            100))
+PROCESS_START_METHOD = os.getenv("PROCESS_START_METHOD", "spawn")
+# how far past its timeout a task stuck in native code may run before its
+# pool's processes are terminated
+PROCESS_KILL_GRACE = float(os.getenv("PROCESS_KILL_GRACE", 5))
+FRAME_WORKERS = int(os.getenv("FRAME_WORKERS", os.cpu_count() or 1))
+FRAME_IN_FLIGHT = int(os.getenv("FRAME_IN_FLIGHT", 2 * FRAME_WORKERS))
+
+POOL_SIZE = Gauge("dagpi_executor_workers",
+                  "Number of workers in the manipulation pool", ["kind"])
+POOL_ACTIVE = Gauge("dagpi_executor_active_tasks",
+                    "Manipulations currently running", ["kind"])
+POOL_QUEUED = Gauge("dagpi_executor_queued_tasks",
+                    "Manipulations waiting for a free worker", ["kind"])
+POOL_REJECTED = Counter("dagpi_executor_rejected_total",
+                        "Manipulations rejected because the queue was full",
+                        ["kind"])
+POOL_QUEUE_WAIT = Histogram("dagpi_executor_queue_wait_seconds",
+                            "Time a manipulation waited for a worker",
+                            ["kind"])
+POOL_TIMEOUTS = Counter("dagpi_executor_timeouts_total",
+                        "Manipulations that exceeded their time limit",
+                        ["kind"])
+POOL_RECYCLED = Counter("dagpi_executor_recycled_total",
+                        "Worker pools retired and replaced", ["kind"])
+
+
+class ManipulationPool:
+    """A process wide executor with a bounded admission queue.
+
+    Submitting more than ``workers + max_queue`` tasks at once raises
+    :class:`ServerBusy` instead of queueing without limit.
+    """
+
+    def __init__(self, kind: str, workers: int, max_queue: int):
+        self.kind = kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        POOL_SIZE.labels(kind).set(workers)
+
+    def _create_executor(self) -> futures.Executor:
+        return futures.ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix=f"dagpi-{self.kind}")
+
+    @property
+    def executor(self) -> futures.Executor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._create_executor()
+            return self._executor
+
+    def _run(self, enqueued: float, function, *args, **kwargs):
+        POOL_QUEUE_WAIT.labels(self.kind).observe(
+            time.perf_counter() - enqueued)
+        POOL_QUEUED.labels(self.kind).dec()
+        POOL_ACTIVE.labels(self.kind).inc()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            POOL_ACTIVE.labels(self.kind).dec()
+
+    def _release(self, future: futures.Future):
+        if future.cancelled():
+            POOL_QUEUED.labels(self.kind).dec()
+        with self._lock:
+            self._pending -= 1
+
+    def admit(self):
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                POOL_REJECTED.labels(self.kind).inc()
+                raise ServerBusy("Manipulation queue is full")
+            self._pending += 1
+
+    def submit(self, function, *args, **kwargs) -> asyncio.Future:
+        self.admit()
+        return self._submit(function, *args, **kwargs)
+
+    def resume(self, function, *args, **kwargs) -> asyncio.Future:
+        """Submit a later step of a task that was already admitted, such
+        as the next chunk of a stream, without checking the queue limit."""
+        with self._lock:
+            self._pending += 1
+        return self._submit(function, *args, **kwargs)
+
+    def _submit(self, function, *args, **kwargs) -> asyncio.Future:
+        POOL_QUEUED.labels(self.kind).inc()
+        try:
+            future = self.executor.submit(self._run, time.perf_counter(),
+                                          function, *args, **kwargs)
+        except Exception:
+            POOL_QUEUED.labels(self.kind).dec()
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(self._release)
+        return asyncio.wrap_future(future)
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+def _process_init(modules):
+    for module in modules:
+        importlib.import_module(module)
+
+
+def _process_warm():
+    pass
+
+
+def _process_alarm(_signum, _frame):
+    raise ManipulationTimeout("Manipulation took too long")
+
+
+def _process_call(module: str, name: str, timeout: float, args, kwargs):
+    started = time.time()
+    function = getattr(importlib.import_module(module), name).__wrapped__
+    # timed from here, when the task starts, not from when it was queued.
+    # The alarm interrupts Python code, the parent terminates a worker
+    # stuck in native code for longer
+    signal.signal(signal.SIGALRM, _process_alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return started, function(*args, **kwargs)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _retrieve(future: asyncio.Future):
+    if not future.cancelled():
+        future.exception()
+
+
+class ProcessManipulationPool(ManipulationPool):
+    """Runs manipulations in warm worker processes.
+
+    Functions are looked up by module and name in the worker, so only
+    module level functions decorated with ``executor(kind="process")``
+    can be submitted. Each task may run for ``timeout`` seconds from when
+    it starts. The pool is replaced after ``workers * max_tasks_per_child``
+    tasks, and its processes are terminated once a task has been in the
+    workers' hands for two periods of its timeout plus
+    ``PROCESS_KILL_GRACE``, so workers can neither grow without bound nor
+    pile up behind stuck ones. Retired pools are shut down, and their
+    replacements started, in a background thread.
+    """
+
+    def __init__(self, kind: str, workers: int, max_queue: int,
+                 timeout: float, max_tasks_per_child: int):
+        super().__init__(kind, workers, max_queue)
+        self.timeout = timeout
+        self.max_tasks_per_child = max_tasks_per_child
+        self.modules = set()
+        self._submitted = 0
+        # the pool being replaced in the background, if any
+        self._replacing = None
+
+    def _create_executor(self) -> futures.Executor:
+        return futures.ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(PROCESS_START_METHOD),
+            initializer=_process_init,
+            initargs=(tuple(sorted(self.modules)),))
+
+    def start(self):
+        """Start every worker now, rather than on the first task."""
+        self._warm(self.executor)
+
+    def _warm(self, executor: futures.Executor):
+        for _ in range(self.workers):
+            executor.submit(_process_warm)
+
+    def _retire(self, executor: futures.Executor, terminate: bool = False):
+        """Replace ``executor`` with a new pool. With ``terminate`` its
+        processes are killed and no more tasks are sent to it."""
+        with self._lock:
+            current = self._executor is executor
+            replace = current and self._replacing is not executor
+            if replace:
+                self._replacing = executor
+                self._submitted = 0
+            if terminate and current:
+                self._executor = None
+        if terminate:
+            # shutdown alone would leave a stuck worker running next to
+            # the replacement pool
+            # a pool already shut down has no processes left
+            for process in list((executor._processes or {}).values()):
+                process.terminate()
+        if replace:
+            POOL_RECYCLED.labels(self.kind).inc()
+            threading.Thread(target=self._replace, args=(executor,),
+                             name=f"dagpi-{self.kind}-recycle",
+                             daemon=True).start()
+
+    def _replace(self, executor: futures.Executor):
+        # spawning the new processes and joining the old ones both block,
+        # so they happen here, and tasks keep going to the old pool until
+        # the new one is up
+        replacement = self._create_executor()
+        self._warm(replacement)
+        with self._lock:
+            if self._executor is executor or self._executor is None:
+                self._executor, replacement = replacement, None
+            self._replacing = None
+        if replacement is not None:
+            replacement.shutdown(wait=False)
+        executor.shutdown(wait=True)
+
+    def _release(self, future: futures.Future):
+        POOL_ACTIVE.labels(self.kind).dec()
+        with self._lock:
+            self._pending -= 1
+
+    async def _wait(self, executor: futures.Executor, future: futures.Future,
+                    enqueued: float):
+        waiter = asyncio.wrap_future(future)
+        # retrieved here too, as the wait below may give up on it
+        waiter.add_done_callback(_retrieve)
+        limit = self.timeout + PROCESS_KILL_GRACE
+        seen_running = False
+        while True:
+            try:
+                started, result = await asyncio.wait_for(
+                    asyncio.shield(waiter), limit)
+                break
+            except ManipulationTimeout:
+                POOL_TIMEOUTS.labels(self.kind).inc()
+                raise
+            except asyncio.TimeoutError:
+                # a task still waiting for a worker is not stuck. Once
+                # handed to the workers it may wait behind one task per
+                # worker, so it is given up on only after a whole further
+                # limit in their hands
+                if not future.running() or not seen_running:
+                    seen_running = future.running()
+                    continue
+                POOL_TIMEOUTS.labels(self.kind).inc()
+                self._retire(executor, terminate=True)
+                raise ManipulationTimeout("Manipulation took too long")
+            except futures.BrokenExecutor:
+                # tasks sent to it until the replacement is up would fail
+                self._retire(executor, terminate=True)
+                raise ManipulationError("Manipulation worker was restarted")
+        POOL_QUEUE_WAIT.labels(self.kind).observe(max(0.0, started - enqueued))
+        return result
+
+    def submit(self, function, *args, **kwargs):
+        self.admit()
+        # queued and running tasks cannot be told apart without asking
+        # the workers, so every task they hold counts as active
+        POOL_ACTIVE.labels(self.kind).inc()
+        try:
+            executor = self.executor
+            future = executor.submit(_process_call, function.__module__,
+                                     function.__qualname__, self.timeout,
+                                     args, kwargs)
+        except Exception as e:
+            POOL_ACTIVE.labels(self.kind).dec()
+            with self._lock:
+                self._pending -= 1
+            if isinstance(e, futures.BrokenExecutor):
+                self._retire(executor, terminate=True)
+            raise
+        future.add_done_callback(self._release)
+        with self._lock:
+            self._submitted += 1
+            recycle = self._submitted >= \
+                self.workers * self.max_tasks_per_child
+        if recycle:
+            self._retire(executor)
+        return self._wait(executor, future, time.time())
+
+
+class FramePool:
+    """Runs a manipulation over the frames of an animation in parallel.
+
+    Manipulations call it from their own worker, so it has its own
+    threads rather than waiting on the pool it is running in. Each call
+    keeps at most ``in_flight`` frames queued or running, and takes
+    frames from its iterable only as those finish, which bounds the
+    memory a long animation can use.
+    """
+
+    def __init__(self, workers: int, in_flight: int):
+        self.workers = workers
+        self.in_flight = max(1, in_flight)
+        self._executor = None
+        self._lock = threading.Lock()
+        POOL_SIZE.labels("frame").set(workers)
+
+    @property
+    def executor(self) -> futures.Executor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = futures.ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix="dagpi-frame")
+            return self._executor
+
+    def map(self, function, frames: Iterable, *args,
+            **kwargs) -> Iterator:
+        """Yield ``function(frame, *args, **kwargs)`` for every frame, in
+        order."""
+        if self.workers <= 1:
+            for frame in frames:
+                yield function(frame, *args, **kwargs)
+            return
+        executor = self.executor
+        window = deque()
+        try:
+            for frame in frames:
+                if len(window) >= self.in_flight:
+                    yield window.popleft().result()
+                window.append(executor.submit(function, frame, *args,
+                                              **kwargs))
+            while window:
+                yield window.popleft().result()
+        finally:
+            for future in window:
+                future.cancel()
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+thread_pool = ManipulationPool("thread", POOL_WORKERS, POOL_QUEUE_DEPTH)
+process_pool = ProcessManipulationPool("process", PROCESS_WORKERS,
+                                       PROCESS_QUEUE_DEPTH,
+                                       PROCESS_TASK_TIMEOUT,
+                                       PROCESS_MAX_TASKS_PER_CHILD)
+frame_pool = FramePool(FRAME_WORKERS, FRAME_IN_FLIGHT)
+
+
+def start_executors():
+    process_pool.start()
+
+
+def shutdown_executors():
+    thread_pool.shutdown(wait=True)
+    process_pool.shutdown(wait=True)
+    frame_pool.shutdown(wait=True)
+
+
+def _start_stream(function, args, kwargs):
+    chunks = iter(function(*args, **kwargs))
+    return chunks, next(chunks, None)
+
+
+def _close_stream(chunks):
+    # a chunk still being produced on the pool finishes on its own
+    if not getattr(chunks, "gi_running", False):
+        chunks.close()
+
+
+async def _iterate_stream(chunks, chunk):
+    try:
+        while chunk is not None:
+            yield chunk
+            chunk = await thread_pool.resume(next, chunks, None)
+    finally:
+        _close_stream(chunks)
+
+
+async def stream(function, *args, **kwargs):
+    """Run a manipulation that yields its output in chunks.
+
+    Producing the first chunk goes through the pool's admission check and
+    any error it raises is raised here, before a response is started.
+    Later chunks are produced on the pool as they are consumed.
+    """
+    chunks, first = await thread_pool.submit(_start_stream, function, args,
+                                             kwargs)
+    return _iterate_stream(chunks, first)
+
+
+def executor(function=None, *, kind: str = "thread"):
+    """Run a manipulation off the event loop.
+
+    ``@executor`` uses the shared thread pool. ``@executor(kind="process")``
+    ships the arguments to the process pool instead, for pure Python
+    manipulations that would otherwise hold the GIL.
+    ``@executor(kind="stream")`` is for generators of output chunks, and
+    resolves to an async iterator over them.
+    """
+    if function is None:
+        return functools.partial(executor, kind=kind)
+    if kind == "process":
+        process_pool.modules.add(function.__module__)
+    elif kind not in ("thread", "stream"):
+        raise ValueError(f"Unknown executor kind {kind}")
 
-def executor(function):
     @functools.wraps(function)
     def decorator(*args, **kwargs):
         try:
+            if kind == "process":
+                return process_pool.submit(function, *args, **kwargs)
+            if kind == "stream":
+                return stream(function, *args, **kwargs)
             partial = functools.partial(function, *args, **kwargs)
-            loop = asyncio.get_event_loop()
-            return loop.run_in_executor(futures.ThreadPoolExecutor(), partial)
+            return thread_pool.submit(partial)
+        except ServerBusy:
+            raise
         except Exception as e:
             raise ManipulationError(str(e))
 
+    decorator.kind = kind
+    decorator.streams = kind == "stream"
     return decorator
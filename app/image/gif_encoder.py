@@ -0,0 +1,428 @@
+import os
+import struct
+from io import BytesIO
+from typing import Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+from PIL import GifImagePlugin, Image
+
+GIF_COLORS = int(os.getenv("GIF_COLORS", 256))
+GIF_DITHER = os.getenv("GIF_DITHER", "0").lower() in ("1", "true", "yes")
+# "frame" gives every frame a palette of its own, "shared" maps all frames
+# onto one palette built from a sample of them
+GIF_PALETTE = os.getenv("GIF_PALETTE", "frame")
+# frames sampled, and pixels taken from them, to build the shared palette
+GIF_PALETTE_FRAMES = int(os.getenv("GIF_PALETTE_FRAMES", 16))
+GIF_PALETTE_PIXELS = int(os.getenv("GIF_PALETTE_PIXELS", 2 ** 18))
+# unchanged pixels inside a frame's changed rectangle are left transparent
+# only when fewer than this share of its pixels changed; denser changes
+# compress better written out whole
+GIF_MASK_BELOW = float(os.getenv("GIF_MASK_BELOW", 0.5))
+
+Durations = Union[None, int, Sequence[int]]
+
+
+def _rgba(frame: Image) -> np.ndarray:
+    if frame.mode != "RGBA":
+        frame = frame.convert("RGBA")
+    return np.asarray(frame)
+
+
+def _colors(colors: Optional[int]) -> int:
+    colors = GIF_COLORS if colors is None else colors
+    if not 2 <= colors <= 256:
+        raise ValueError("GIF palettes hold between 2 and 256 colors")
+    return colors
+
+
+def _has_transparency(sample: Sequence[np.ndarray]) -> bool:
+    return any((arr[..., 3] < 128).any() for arr in sample)
+
+
+def _mapping(palette: List[int]):
+    """A palette image to map frames onto ``palette`` with, and a lookup
+    folding back onto index 0 whatever the mapping picks from the padding,
+    which holds copies of the first colour."""
+    used = len(palette) // 3
+    image = Image.new("P", (1, 1))
+    image.putpalette(palette + palette[:3] * (256 - used))
+    fold = np.arange(256, dtype=np.uint8)
+    fold[used:] = 0
+    return image, fold
+
+
+def _bbox(mask: np.ndarray):
+    rows = np.flatnonzero(mask.any(axis=1))
+    if not len(rows):
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    return int(rows[0]), int(rows[-1]) + 1, int(cols[0]), int(cols[-1]) + 1
+
+
+class GifEncoder:
+    """Writes frames as a GIF sharing one global palette.
+
+    The palette is built once from a sample of the frames and every frame
+    is mapped onto it, with one index kept free for transparency. When
+    the animation is opaque each frame after the first only carries the
+    rectangle that changed, with unchanged pixels inside it left
+    transparent when few of them changed. Animations with transparency
+    clear every frame and carry only its visible rectangle.
+
+    ``add`` and ``finish`` return the encoded bytes as they become
+    available, so the output can be written out while frames are still
+    being produced.
+    """
+
+    def __init__(self, sample: Sequence[Image], *, colors: int = None,
+                 dither: bool = None, loop: Optional[int] = 0,
+                 transparent: bool = None):
+        colors = _colors(colors)
+        self.dither = GIF_DITHER if dither is None else dither
+        self.loop = loop
+        step = max(1, len(sample) // GIF_PALETTE_FRAMES)
+        sample = [_rgba(frame) for frame in sample[::step]]
+        if transparent is None:
+            transparent = _has_transparency(sample)
+        self.transparent = transparent
+        self._build_palette(sample, colors - 1)
+        self.size = None
+        self._previous = None
+        self._pending = None
+
+    def _build_palette(self, sample: List[np.ndarray], colors: int):
+        per_frame = GIF_PALETTE_PIXELS // max(1, len(sample))
+        pixels = []
+        for arr in sample:
+            area = arr.shape[0] * arr.shape[1]
+            stride = max(1, int((area / per_frame) ** 0.5))
+            part = arr[::stride, ::stride].reshape(-1, 4)
+            pixels.append(part[part[:, 3] >= 128, :3])
+        pixels = np.concatenate(pixels) if pixels else []
+        if not len(pixels):
+            pixels = np.zeros((1, 3), dtype=np.uint8)
+        sample_image = Image.fromarray(
+            np.ascontiguousarray(pixels.reshape(1, -1, 3), dtype=np.uint8),
+            "RGB")
+        # fast octree, it builds the palette in about half the time of
+        # median cut and its palettes map onto frames more compressibly
+        quantized = sample_image.quantize(colors=colors, method=2)
+        used = max(index for _count, index in quantized.getcolors(256)) + 1
+        palette = quantized.getpalette()[:used * 3]
+        self._palette_image, self._fold = _mapping(palette)
+        self.transparent_index = used
+        # the spare slot is black; only its index is ever used
+        self.palette = bytes(palette) + b"\0\0\0"
+
+    def _indices(self, frame: Image):
+        rgb = frame.convert("RGB")
+        quantized = rgb.quantize(palette=self._palette_image,
+                                 dither=1 if self.dither else 0)
+        indices = self._fold[np.asarray(quantized)]
+        alpha = _rgba(frame)[..., 3] if self.transparent else None
+        return indices, alpha
+
+    def header(self) -> bytes:
+        return _header(self.size, self.palette, self.loop)
+
+    def _encode(self, frame: Image):
+        indices, alpha = self._indices(frame)
+        params = {"transparency": self.transparent_index}
+        if self.transparent:
+            visible = alpha >= 128
+            indices[~visible] = self.transparent_index
+            box = _bbox(visible) or (0, 1, 0, 1)
+            region = indices[box[0]:box[1], box[2]:box[3]]
+            return _palette_image(region), box, dict(params, disposal=2)
+        previous, self._previous = self._previous, indices
+        region, box = _changed_region(indices, previous, indices,
+                                      self.transparent_index)
+        if region is None:
+            return None
+        return _palette_image(region), box, dict(params, disposal=1)
+
+    def add(self, frame: Image, duration: int = 0) -> bytes:
+        """Queue a frame and return any bytes ready to be written.
+
+        A frame identical to the one before it only extends that frame's
+        duration, so each frame is held back until the next arrives.
+        """
+        data = b""
+        if self.size is None:
+            self.size = frame.size
+            data = self.header()
+        elif frame.size != self.size:
+            frame = frame.resize(self.size)
+        encoded = self._encode(frame)
+        if encoded is None:
+            self._pending[1] += duration
+            return data
+        if self._pending is not None:
+            data += self._flush()
+        self._pending = [encoded, duration]
+        return data
+
+    def _flush(self) -> bytes:
+        (image, box, params), duration = self._pending
+        self._pending = None
+        return _write_frame(image, (box[2], box[0]), duration=duration,
+                            **params)
+
+    def finish(self) -> bytes:
+        data = self._flush() if self._pending is not None else b""
+        return data + b";"
+
+
+class FramePaletteEncoder(GifEncoder):
+    """Writes every frame with a palette of its own.
+
+    Frames are quantized one at a time, as Pillow's own writer does, but
+    only over the rectangle that changed since the frame before, so each
+    palette is spent on the pixels actually written. Photographs and
+    effects that move the whole image keep fewer and better placed
+    colours this way than on one palette shared by every frame, and
+    compress better for it.
+    """
+
+    def __init__(self, sample: Sequence[Image], *, colors: int = None,
+                 dither: bool = None, loop: Optional[int] = 0,
+                 transparent: bool = None):
+        self.colors = _colors(colors)
+        self.dither = GIF_DITHER if dither is None else dither
+        self.loop = loop
+        if transparent is None:
+            step = max(1, len(sample) // GIF_PALETTE_FRAMES)
+            transparent = _has_transparency(
+                [_rgba(frame) for frame in sample[::step]])
+        self.transparent = transparent
+        self.size = None
+        self._previous = None
+        self._pending = None
+
+    def header(self) -> bytes:
+        return _header(self.size, None, self.loop)
+
+    def _quantize(self, pixels: np.ndarray, colors: int):
+        crop = Image.fromarray(np.ascontiguousarray(pixels), "RGBA")
+        quantized = crop.quantize(colors=colors, method=2)
+        indices = np.array(quantized)
+        palette = quantized.getpalette()[:(int(indices.max()) + 1) * 3]
+        if self.dither:
+            image, fold = _mapping(palette)
+            indices = fold[np.asarray(crop.convert("RGB").quantize(
+                palette=image, dither=1))]
+        return indices, palette
+
+    def _encode(self, frame: Image):
+        pixels = _rgba(frame)
+        if self.transparent:
+            visible = pixels[..., 3] >= 128
+            box = _bbox(visible) or (0, 1, 0, 1)
+            # cleared frames show through to the transparent index, so
+            # every frame keeps one even when its rectangle is all visible
+            hidden = ~visible[box[0]:box[1], box[2]:box[3]]
+            params = {"disposal": 2}
+        else:
+            # each pixel packed into one integer so frames compare in 2D
+            packed = pixels.view(np.uint32)[..., 0]
+            previous, self._previous = self._previous, packed
+            box, hidden = _changes(packed, previous)
+            if box is None:
+                return None
+            params = {"disposal": 1}
+        if not self.transparent and hidden is not None and not hidden.any():
+            hidden = None
+        top, bottom, left, right = box
+        # one colour fewer leaves room for the transparent index
+        indices, palette = self._quantize(
+            pixels[top:bottom, left:right],
+            self.colors - (hidden is not None))
+        if hidden is not None:
+            params["transparency"] = len(palette) // 3
+            indices[hidden] = params["transparency"]
+            palette = palette + [0, 0, 0]
+        image = _palette_image(indices)
+        image.putpalette(palette)
+        return image, box, dict(params, include_color_table=True)
+
+
+class LocalPaletteEncoder(GifEncoder):
+    """Writes palette images with their own colour tables.
+
+    For effects where the palette is the point, such as showing an image
+    with a growing number of colours, and a shared palette would undo it.
+    Frames are still cropped to the area that changed, and unchanged
+    pixels inside it are left transparent when the frame's palette has
+    room for a transparent entry.
+    """
+
+    def __init__(self, loop: Optional[int] = 0):
+        self.loop = loop
+        self.size = None
+        self._previous = None
+        self._pending = None
+
+    def header(self) -> bytes:
+        return _header(self.size, None, self.loop)
+
+    def _encode(self, frame: Image):
+        if frame.mode != "P":
+            frame = frame.convert("P", palette=Image.ADAPTIVE)
+        indices = np.asarray(frame)
+        palette = frame.getpalette()[:768]
+        colours = np.frombuffer(bytes(palette), dtype=np.uint8).reshape(-1, 3)
+        # each colour packed into one integer so frames compare in 2D
+        packed = colours.astype(np.uint32) @ np.array([1 << 16, 1 << 8, 1],
+                                                      dtype=np.uint32)
+        rgb = packed[indices]
+        previous, self._previous = self._previous, rgb
+        # the spare slot follows the highest index in use
+        spare = int(indices.max()) + 1
+        if spare > 255:
+            spare = None
+        # the colours already on screen stay put in runs, so masking them
+        # pays off however much of the rectangle changed
+        region, box = _changed_region(rgb, previous, indices, spare, 1.0)
+        if region is None:
+            return None
+        image = _palette_image(region)
+        if spare is not None:
+            palette = palette[:spare * 3]
+            palette += [0] * (spare * 3 + 3 - len(palette))
+        image.putpalette(palette)
+        params = {"disposal": 1, "include_color_table": True}
+        if spare is not None and previous is not None:
+            params["transparency"] = spare
+        return image, box, params
+
+
+def _header(size, palette: Optional[bytes], loop: Optional[int]) -> bytes:
+    width, height = size
+    flags = 0
+    if palette is not None:
+        count = len(palette) // 3
+        bits = max(1, (count - 1).bit_length())
+        palette = palette.ljust(3 * 2 ** bits, b"\0")
+        flags = 0x80 | ((bits - 1) << 4) | (bits - 1)
+    data = b"GIF89a" + struct.pack("<HHBBB", width, height, flags, 0, 0)
+    if palette is not None:
+        data += palette
+    if loop is not None:
+        data += b"!\xff\x0bNETSCAPE2.0\x03\x01" + \
+            struct.pack("<H", loop) + b"\0"
+    return data
+
+
+def _palette_image(indices: np.ndarray) -> Image:
+    return Image.fromarray(np.ascontiguousarray(indices), "P")
+
+
+def _changes(pixels: np.ndarray, previous: Optional[np.ndarray],
+             mask_below: float = None):
+    """The rectangle where ``pixels`` differs from ``previous``, and the
+    unchanged pixels inside it that are worth leaving transparent.
+
+    Returns ``(None, None)`` when nothing changed, and no mask for the
+    first frame or when at least ``mask_below`` of the rectangle changed.
+    """
+    if previous is None:
+        return (0, pixels.shape[0], 0, pixels.shape[1]), None
+    changed = pixels != previous
+    if changed.ndim == 3:
+        changed = changed.any(axis=2)
+    box = _bbox(changed)
+    if box is None:
+        return None, None
+    top, bottom, left, right = box
+    changed = changed[top:bottom, left:right]
+    if changed.mean() >= (GIF_MASK_BELOW if mask_below is None
+                          else mask_below):
+        return box, None
+    return box, ~changed
+
+
+def _changed_region(pixels: np.ndarray, previous: Optional[np.ndarray],
+                    indices: np.ndarray, spare: Optional[int],
+                    mask_below: float = None):
+    """Crop ``indices`` to where ``pixels`` differs from ``previous``.
+
+    Unchanged pixels inside the crop are set to ``spare``, the
+    transparent index, when there is one and changes are sparse enough.
+    Returns ``(None, None)`` when nothing changed.
+    """
+    box, unchanged = _changes(pixels, previous, mask_below)
+    if box is None:
+        return None, None
+    top, bottom, left, right = box
+    region = indices[top:bottom, left:right].copy()
+    if spare is not None and unchanged is not None:
+        region[unchanged] = spare
+    return region, box
+
+
+def _write_frame(image: Image, offset, **params) -> bytes:
+    return b"".join(GifImagePlugin.getdata(image, offset=offset, **params))
+
+
+def _durations(frames: Sequence[Image], duration: Durations) -> List[int]:
+    if duration is None:
+        # Pillow's default, the first frame's duration for every frame
+        duration = frames[0].info.get("duration", 0)
+    if isinstance(duration, (list, tuple)):
+        return [int(d) for d in duration]
+    return [int(duration)] * len(frames)
+
+
+def _encoder(palette: Optional[str]):
+    palette = GIF_PALETTE if palette is None else palette
+    if palette == "frame":
+        return FramePaletteEncoder
+    if palette == "shared":
+        return GifEncoder
+    raise ValueError(f"Unknown GIF palette {palette}")
+
+
+def encode_gif(frames: Iterable[Image], duration: Durations = None,
+               loop: Optional[int] = 0, colors: int = None,
+               dither: bool = None, palette: str = None) -> BytesIO:
+    """Encode frames into an animated GIF.
+
+    ``colors``, ``dither`` and ``palette`` default to the ``GIF_COLORS``,
+    ``GIF_DITHER`` and ``GIF_PALETTE`` settings.
+    """
+    frames = list(frames)
+    encoder = _encoder(palette)(frames, colors=colors, dither=dither,
+                                loop=loop)
+    io = BytesIO()
+    for frame, frame_duration in zip(frames, _durations(frames, duration)):
+        io.write(encoder.add(frame, frame_duration))
+    io.write(encoder.finish())
+    io.seek(0)
+    return io
+
+
+def stream_gif(frames: Iterable[Image], duration: int = 0,
+               loop: Optional[int] = 0, sample: Sequence[Image] = None,
+               colors: int = None, dither: bool = None,
+               transparent: bool = None, palette: str = None,
+               local_palettes: bool = False) -> Iterator[bytes]:
+    """Encode frames into GIF data as they are produced.
+
+    Only one frame is held at a time, so a shared palette comes from
+    ``sample`` when given and from the first frame otherwise. With
+    ``local_palettes`` palette images keep their own colours instead.
+    """
+    frames = iter(frames)
+    first = next(frames)
+    if local_palettes:
+        encoder = LocalPaletteEncoder(loop=loop)
+    else:
+        encoder = _encoder(palette)(sample or [first], colors=colors,
+                                    dither=dither, loop=loop,
+                                    transparent=transparent)
+    yield encoder.add(first, duration)
+    for frame in frames:
+        data = encoder.add(frame, duration)
+        if data:
+            yield data
+    yield encoder.finish()
@@ -9,6 +9,7 @@ from wand.image import Image as wImage
 from PIL import Image, ImageSequence, ImageFilter, ImageChops, ImageEnhance, ImageDraw
 
 from app.exceptions.errors import BadImage, ParameterError, ManipulationError
+from app.image.gif_encoder import encode_gif
 
 __all__ = ('neon', 'a_neon')
 
@@ -556,14 +557,13 @@ def neon(oim, colors, **kwargs):
                         gradient_direction=gradient_direction,
                         **kwargs
                         )
-    final = io.BytesIO()
     if isinstance(image, list):
-        ext = 'gif'
         if gradient == 2 and gradient_direction in (1, 2):
             # reverse images to simulate moving the opposite direction
             image.reverse()
-        image[0].save(final, format=ext, save_all=True, dispose=2, append_images=image[1:], loop=0)
+        return encode_gif(image, loop=0)
     else:
+        final = io.BytesIO()
         # single image, save normally
         ext = 'png'
         image.save(final, format=ext)
@@ -656,10 +656,6 @@ def a_neon(oim, colors, **kwargs):
                                       colors_per_frame=colors_per_frame or 2,
                                       max_size=256,
                                       **kwargs)
-    final = io.BytesIO()
     if not isinstance(image, list):
         raise ManipulationError(f'Got {type(image)} instead of list of PIL.Image')
-    ext = 'gif'
-    image[0].save(final, format=ext, save_all=True, dispose=2, append_images=image[1:], duration=durations, loop=0)
-    final.seek(0)
-    return final
+    return encode_gif(image, duration=durations, loop=0)
@@ -1,17 +1,21 @@
+import itertools
+import os
 import random
 from io import BytesIO
+from typing import Iterator
 import math
 import numpy as np
 from PIL import Image
 from PIL import Image as PILImage
-from PIL import (ImageDraw, ImageEnhance, ImageFilter, ImageFont, ImageOps,
-                 ImageSequence)
+from PIL import ImageDraw, ImageEnhance, ImageFilter, ImageFont, ImageOps
 
 import app.image.neon as _neon
 from app.exceptions.errors import ParameterError
 from app.image.PILManip import PILManip, double_image, pil, static_pil
+from app.image.asset_registry import assets
 from app.image.decorators import executor
-from app.image.writetext import WriteText
+from app.image.gif_encoder import encode_gif, stream_gif
+from app.image.writetext import WriteText, get_font
 
 __all__ = (
     "angel",
@@ -59,6 +63,38 @@ __all__ = (
     "shake"
 )
 
+assets.register("speech", "speech.jpg", size=(800, 600), resample=Image.BOX)
+assets.register("hitler", "hitler.jpg", size=(800, 600), resample=Image.BOX)
+assets.register("jail", "jail.png")
+assets.register("gay", "gayfilter.png")
+assets.register("glass", "glass.png", mode="RGBA", size=(300, 300))
+assets.register("wasted", "wasted.png", mode="RGBA")
+assets.register("triggered", "triggered.png")
+assets.register("5g1g", "5g1g.png")
+assets.register("whyareyougay", "whyareyougay.png")
+assets.register("slap", "slap.png", mode="RGBA")
+assets.register("satan", "satan.jpg", size=(800, 600), resample=Image.BOX)
+assets.register("delete", "delete.BMP", mode="RGBA")
+assets.register("wanted", "wanted.png")
+assets.register("obama", "obama.png")
+assets.register("sithlord", "sithlord.jpg")
+assets.register("trash", "trash.jpg", size=(800, 600),
+                resample=Image.HAMMING)
+assets.register("bad", "bad.png")
+assets.register("fedora", "fedora.bmp", mode="RGBA")
+assets.register("angel", "angel.jpg", size=(800, 600), resample=Image.BOX)
+assets.register("america", "america.gif", size=(480, 480),
+                resample=Image.HAMMING, frames=True)
+assets.register("communism", "communism.gif", frames=True)
+assets.register("hammer_raised", "hammer_raised.png", mode="RGBA")
+assets.register("hammer_down", "hammer_down.png", mode="RGBA")
+assets.register("bomb", "bomb.gif", size=(512, 512), frames=True)
+for _i in range(5):
+    assets.register(f"petpet{_i}", f"PetPetFrames/frame{_i}.png", mode="RGBA")
+for _flag in os.listdir(os.path.join(assets.directory, "pride")):
+    assets.register(f"pride/{_flag[:-4]}", f"pride/{_flag}", mode="RGBA",
+                    size=(300, 300))
+
 
 @executor
 @pil
@@ -76,9 +112,9 @@ def pixelate(image):
 
 
 @executor
-@pil
+@pil(size=(200, 225))
 def thought_image(image, file: str):
-    im = Image.open("app/image/assets/speech.jpg")
+    fim = assets.get("speech")
     if len(file) > 200:
         raise ParameterError(
             f"Your text is too long {len(file)} is greater than 200")
@@ -101,15 +137,11 @@ def thought_image(image, file: str):
         ff = file
         size = 25
     pfp = image.resize((200, 225), 5)
-    width = 800
-    height = 600
-    fim = im.resize((width, height), 4)
     area = (125, 50)
     fim.paste(pfp, area)
     base = fim.convert("RGBA")
     txt = Image.new("RGBA", base.size, (255, 255, 255, 0))
-    fnt = ImageFont.truetype("app/image/assets/Helvetica-Bold-Font.ttf",
-                             size)
+    fnt = get_font("app/image/assets/Helvetica-Bold-Font.ttf", size)
     d = ImageDraw.Draw(txt)
     d.text((400, 150), f"{ff}", font=fnt, fill=(0, 0, 0, 255))
     return Image.alpha_composite(base, txt)
@@ -155,13 +187,10 @@ def blur(image):
 
 
 @executor
-@pil
+@pil(size=(260, 300))
 def htiler(image):
-    im = Image.open("app/image/assets/hitler.jpg")
+    fim = assets.get("hitler")
     pfp = image.resize((260, 300), 5)
-    width = 800
-    height = 600
-    fim = im.resize((width, height), 4)
     area = (65, 40)
     fim.paste(pfp, area)
     return fim
@@ -171,7 +200,7 @@ def htiler(image):
 @pil
 def jail(image):
     w, h = image.size
-    fil = Image.open("app/image/assets/jail.png")
+    fil = assets.shared("jail")
     filled = fil.resize((w, h), 5).convert("RGBA")
     ci = image.convert("RGBA")
     ci.paste(filled, mask=filled)
@@ -182,87 +211,70 @@ def jail(image):
 @pil
 def gay(image):
     w, h = image.size
-    fil = Image.open("app/image/assets/gayfilter.png")
+    fil = assets.shared("gay")
     filled = fil.resize((w, h), 5).convert("RGBA")
     ci = image.convert("RGBA")
     ci.paste(filled, mask=filled)
     return ci
 
 
-@executor
+# sin(atan2(a, b)) * 255 for every pair of channel values, computed with
+# math so the vectorized earth filter matches the per pixel original exactly
+_EARTH_LUT = np.array([[int(math.sin(math.atan2(a, b)) * 255)
+                        for b in range(256)] for a in range(256)],
+                      dtype=np.uint8)
+
+
+def _rgb_channels(img):
+    arr = np.asarray(img.convert("RGB"), dtype=np.int32)
+    return arr[..., 0], arr[..., 1], arr[..., 2]
+
+
+def _rgb_image(*channels):
+    arr = np.stack(channels, axis=-1)
+    return Image.fromarray(np.minimum(arr, 255).astype(np.uint8), "RGB")
+
+
+@executor(kind="process")
 @pil
 def molten(img):
-    img = img.convert("RGB")
-    width, height = img.size
-    pix = img.load()
-    for w in range(width):
-        for h in range(height):
-            r, g, b = pix[w, h]
-            pix[w, h] = min(255, int(abs(r * 128 / (g + b + 1)))), \
-                min(255, int(abs(g * 128 / (b + r + 1)))), \
-                min(255, int(abs(b * 128 / (r + g + 1))))
-
-    return img
+    r, g, b = _rgb_channels(img)
+    return _rgb_image((r * 128 / (g + b + 1)).astype(np.int32),
+                      (g * 128 / (b + r + 1)).astype(np.int32),
+                      (b * 128 / (r + g + 1)).astype(np.int32))
 
 
-@executor
+@executor(kind="process")
 @pil
 def ice(img):
-    img = img.convert("RGB")
-    width, height = img.size
-    pix = img.load()
-    for w in range(width):
-        for h in range(height):
-            r, g, b = pix[w, h]
-            pix[w, h] = min(255, int(abs(r - g - b) * 3 / 2)), \
-                min(255, int(abs(g - b - r) * 3 / 2)), \
-                min(255, int(abs(b - r - g) * 3 / 2))
+    r, g, b = _rgb_channels(img)
+    return _rgb_image(np.abs(r - g - b) * 3 // 2,
+                      np.abs(g - b - r) * 3 // 2,
+                      np.abs(b - r - g) * 3 // 2)
 
-    return img
 
-
-@executor
+@executor(kind="process")
 @pil
 def earth(img):
-    img = img.convert("RGB")
-    width, height = img.size
-    pix = img.load()
-    for w in range(width):
-        for h in range(height):
-            r, g, b = pix[w, h]
-            pix[w, h] = int(math.sin(math.atan2(g, b)) * 255), \
-                int(math.sin(math.atan2(b, r)) * 255), \
-                int(math.sin(math.atan2(r, g)) * 255)
-
-    return img
+    r, g, b = _rgb_channels(img)
+    return _rgb_image(_EARTH_LUT[g, b], _EARTH_LUT[b, r], _EARTH_LUT[r, g])
 
 
-@executor
+@executor(kind="process")
 @pil
 def comic_manip(img):
-    img = img.convert("RGB")
-    width, height = img.size
-    pix = img.load()
-    for w in range(width):
-        for h in range(height):
-            r, g, b = pix[w, h]
-            pix[w, h] = tuple(map(lambda i: min(255, i),
-                                  [
-                abs(g - b + g + r) * r // 256,
-                abs(b - g + b + r) * r // 256,
-                abs(b - g + b + r) * r // 256]))
-
-    return img.convert('L')
+    r, g, b = _rgb_channels(img)
+    first = np.abs(g - b + g + r) * r // 256
+    second = np.abs(b - g + b + r) * r // 256
+    return _rgb_image(first, second, second).convert('L')
 
 
 @executor
-@pil
+@pil(size=(300, 300))
 def pride(image, flag: str):
-    try:
-        im = Image.open(f"app/image/assets/pride/{flag}.png").convert(
-            "RGBA").resize((300, 300))
-    except FileNotFoundError:
+    if f"pride/{flag}" not in assets:
         raise ParameterError(f"Invalid Pride Filter {flag}")
+    im = assets.get(f"pride/{flag}")
     ima = image.resize((300, 300)).convert("RGBA")
     im.putalpha(175)
     ima.paste(im, (0, 0), mask=im)
@@ -270,10 +282,9 @@ def pride(image, flag: str):
 
 
 @executor
-@pil
+@pil(size=(300, 300))
 def shatter(image):
-    im = Image.open("app/image/assets/glass.png").convert(
-        "RGBA").resize((300, 300))
+    im = assets.shared("glass")
     ima = image.resize((300, 300)).convert("RGBA")
     ima.paste(im, (0, 0), mask=im)
     return ima
@@ -283,7 +294,7 @@ def shatter(image):
 @pil
 def wasted(image):
     w, h = image.size
-    fil = Image.open("app/image/assets/wasted.png").convert("RGBA")
+    fil = assets.shared("wasted")
     fil_r = fil.resize((w, h), 5)
     conv_im = image.convert("RGBA")
     conv_im.paste(fil_r, mask=fil_r)
@@ -292,9 +303,9 @@ def wasted(image):
 
 @executor
 def triggered(byt: bytes):
-    im = PILManip.pil_image(byt)
+    im = PILManip.pil_image(byt, (500, 500))
     im = im.resize((500, 500), 1)
-    overlay = Image.open("app/image/assets/triggered.png")
+    overlay = assets.shared("triggered")
     ml = []
     for _si in range(30):
         blank = Image.new("RGBA", (400, 400))
@@ -309,9 +320,9 @@ def triggered(byt: bytes):
 
 
 @executor
-@double_image
+@double_image(size=(150, 150))
 def five_guys_one_girl(im, im2):
-    back = Image.open("app/image/assets/5g1g.png")
+    back = assets.get("5g1g")
     im = im.resize((150, 150), 1)
     back.paste(im, (80, 100))
     back.paste(im, (320, 10))
@@ -324,9 +335,9 @@ def five_guys_one_girl(im, im2):
 
 
 @executor
-@double_image
+@double_image(size=(150, 150))
 def why_are_you_gay(gay_image, av_image):
-    im = Image.open("app/image/assets/whyareyougay.png")
+    im = assets.get("whyareyougay")
     mp = av_image.resize((150, 150), 0)
     op = gay_image.resize((150, 150), 0)
     im.paste(op, (550, 100))
@@ -335,9 +346,9 @@ def why_are_you_gay(gay_image, av_image):
   
 
 @executor
-@double_image
+@double_image(size=(110, 110))
 def slap(im, im2):
-    base = Image.open("app/image/assets/slap.png").convert("RGBA")
+    base = assets.get("slap")
     im = im.resize((90, 90), 1).convert("RGBA")
     im2 = im2.resize((110, 110), 1).convert("RGBA")
     base.paste(im, (50, 170))
@@ -352,8 +363,7 @@ def top5colors(image):
         return ("#%02x%02x%02x" % rgb).upper()
 
     w, h = image.size
-    font = ImageFont.truetype("app/image/assets/Helvetica Neu Bold.ttf",
-                              size=30)
+    font = get_font("app/image/assets/Helvetica Neu Bold.ttf", 30)
     im = image.resize((int(w * (256 / h)), 256), 1)
     q = im.quantize(colors=5, method=2)
     pal = q.getpalette()
@@ -413,40 +423,37 @@ def ascii_image(image):
 
 
 @executor
-@pil
+@pil(size=(400, 225))
 def satan(image):
-    im = Image.open("app/image/assets/satan.jpg")
+    fim = assets.get("satan")
     base = image.resize((400, 225), 5)
-    width = 800
-    height = 600
-    fim = im.resize((width, height), 4)
     area = (250, 100)
     fim.paste(base, area)
     return fim
 
 
 @executor
-@pil
+@pil(size=(195, 195))
 def delete(img):
-    im = Image.open("app/image/assets/delete.BMP").convert("RGBA")
+    im = assets.get("delete")
     ima = img.resize((195, 195)).convert("RGBA")
     im.paste(ima, (120, 135), ima)
     return im
 
 
 @executor
-@pil
+@pil(size=(800, 800))
 def wanted(image):
-    im = Image.open("app/image/assets/wanted.png")
+    im = assets.get("wanted")
     tp = image.resize((800, 800), 0)
     im.paste(tp, (200, 450))
     return im
 
 
 @executor
-@pil
+@pil(size=(300, 300))
 def obama(image):
-    obama_pic = Image.open("app/image/assets/obama.png")
+    obama_pic = assets.get("obama")
     y = image.resize((300, 300), 1)
     obama_pic.paste(y, (250, 100))
     obama_pic.paste(y, (650, 0))
@@ -454,9 +461,9 @@ def obama(image):
 
 
 @executor
-@pil
+@pil(size=(250, 275))
 def sithlord(image):
-    im = Image.open("app/image/assets/sithlord.jpg")
+    im = assets.get("sithlord")
     to_pa = image.resize((250, 275), 5)
     size = (225, 225)
     mask = Image.new("L", size, 0)
@@ -468,31 +475,28 @@ def sithlord(image):
 
 
 @executor
-@pil
+@pil(size=(200, 150))
 def trash(image):
-    im = Image.open("app/image/assets/trash.jpg")
+    fim = assets.get("trash")
     wthf = image.resize((200, 150), 5)
-    width = 800
-    height = 600
-    fim = im.resize((width, height), 5)
     area = (500, 250)
     fim.paste(wthf, area)
     return fim
 
 
 @executor
-@pil
+@pil(size=(200, 200))
 def bad_img(image) -> Image:
-    back = Image.open("app/image/assets/bad.png")
+    back = assets.get("bad")
     t = image.resize((200, 200), 5)
     back.paste(t, (20, 150))
     return back
 
 
 @executor
-@pil
+@pil(size=(275, 275))
 def fedora(image):
-    img = Image.open('app/image/assets/fedora.bmp').convert('RGBA')
+    img = assets.shared("fedora")
     av = image.resize((275, 275)).convert('RGBA')
     final = Image.new('RGBA', img.size)
     final.paste(av, (112, 101), av)
@@ -501,19 +505,16 @@ def fedora(image):
 
 
 @executor
-@pil
+@pil(size=(300, 175))
 def angel(image):
-    im = Image.open("app/image/assets/angel.jpg")
+    fim = assets.get("angel")
     base = image.resize((300, 175), 5)
-    width = 800
-    height = 600
-    fim = im.resize((width, height), 4)
     area = (250, 130)
     fim.paste(base, area)
     return fim
 
 
-@executor
+@executor(kind="process")
 @static_pil
 def stringify(im):
     im = im.convert("L")
@@ -552,41 +553,32 @@ def stringify(im):
     return canvas
 
 
-@executor
-@pil
+@executor(kind="process")
+# block sizes are in source pixels, so shrinking the input would change them
+@pil(oversize="reject")
 def mosiac(img, block_size: int = None):
-    if block_size < 1 or block_size > 32:
-        raise ParameterError("Blocksize must be between 1 and 32")
+    if block_size < 1 or block_size > 512:
+        raise ParameterError("Blocksize must be between 1 and 512")
 
     if img.mode != "RGBA":
         img = img.convert("RGBA")
 
-    width, height = img.size
-    pix = img.load()
-
-    dst_img = Image.new("RGBA", (width, height))
-    dst_pix = dst_img.load()
-
-    for w in range(0, width, block_size):
-        for h in range(0, height, block_size):
-            r_sum, g_sum, b_sum = 0, 0, 0
-            size = block_size ** 2
-
-            for i in range(w, min(w + block_size, width)):
-                for j in range(h, min(h + block_size, height)):
-                    r_sum += pix[i, j][0]
-                    g_sum += pix[i, j][1]
-                    b_sum += pix[i, j][2]
-
-            r_ave = int(r_sum / size)
-            g_ave = int(g_sum / size)
-            b_ave = int(b_sum / size)
+    arr = np.asarray(img)
+    height, width = arr.shape[:2]
+    rows = np.arange(0, height, block_size)
+    cols = np.arange(0, width, block_size)
+    # edge blocks are averaged over the pixels they actually cover
+    row_sizes = np.diff(np.append(rows, height))
+    col_sizes = np.diff(np.append(cols, width))
 
-            for i in range(w, min(w + block_size, width)):
-                for j in range(h, min(h + block_size, height)):
-                    dst_pix[i, j] = r_ave, g_ave, b_ave, pix[w, h][3]
+    sums = np.add.reduceat(arr[..., :3], rows, axis=0, dtype=np.uint32)
+    sums = np.add.reduceat(sums, cols, axis=1)
+    blocks = np.empty((len(rows), len(cols), 4), dtype=np.uint8)
+    blocks[..., :3] = sums // np.outer(row_sizes, col_sizes)[..., None]
+    blocks[..., 3] = arr[::block_size, ::block_size, 3]
 
-    return dst_img.convert("P", colors=256)
+    dst = np.repeat(np.repeat(blocks, row_sizes, axis=0), col_sizes, axis=1)
+    return Image.fromarray(dst, "RGBA").convert("P", colors=256)
 
 
 @executor
@@ -666,40 +658,28 @@ def memegen(tv, text: str):
 
 @executor
 def america(byt: bytes) -> BytesIO:
-    img = PILManip.static_pil_image(byt)
+    img = PILManip.static_pil_image(byt, (480, 480))
     image = img.convert("RGBA").resize((480, 480), 5)
-    flag = Image.open("app/image/assets/america.gif")
     image.putalpha(96)
     frame_list = []
-    for frame in ImageSequence.Iterator(flag):
-        frame = frame.resize((480, 480), 5).convert("RGBA")
+    for frame in assets.shared("america"):
+        frame = frame.convert("RGBA")
         frame.paste(image, (0, 0), image)
         frame_list.append(frame)
-    obj = BytesIO()
-    frame_list[0].save(obj, format='gif', save_all=True,
-                       append_images=frame_list[1:], loop=0, disposal=2,
-                       optimize=True)
-    obj.seek(0)
-    return obj
+    return encode_gif(frame_list, loop=0)
 
 
 @executor
 def communism(byt: bytes) -> BytesIO:
-    img = PILManip.static_pil_image(byt)
+    img = PILManip.static_pil_image(byt, (480, 480))
     image = img.convert("RGBA").resize((480, 480), 5)
-    flag = Image.open("app/image/assets/communism.gif")
     image.putalpha(96)
     frame_list = []
-    for frame in ImageSequence.Iterator(flag):
+    for frame in assets.shared("communism"):
         frame = frame.resize((480, 480), 5).convert("RGBA")
         frame.paste(image, (0, 0), image)
         frame_list.append(frame)
-    obj = BytesIO()
-    frame_list[0].save(obj, format='gif', save_all=True,
-                       append_images=frame_list, loop=0, disposal=2,
-                       optimize=True)
-    obj.seek(0)
-    return obj
+    return encode_gif(frame_list, loop=0)
 
 
 # @executor
@@ -728,7 +708,7 @@ def communism(byt: bytes) -> BytesIO:
 @executor
 def petpetgen(byt: bytes, squish=0) -> None:
 
-    img = PILManip.static_pil_image(byt).convert("RGBA")
+    img = PILManip.static_pil_image(byt, (112, 112)).convert("RGBA")
     frame_spec = [
         (27, 31, 86, 90),
         (22, 36, 91, 90),
@@ -750,26 +730,21 @@ def petpetgen(byt: bytes, squish=0) -> None:
         spec = list(frame_spec[i])
         for j, s in enumerate(spec):
             spec[j] = int(s + squish_factor[i][j] * squish)
-        hand = Image.open(f'app/image/assets/PetPetFrames/frame{i}.png').convert("RGBA")
+        hand = assets.shared(f"petpet{i}")
         img = img.resize((int((spec[2] - spec[0]) * 1.2), int((spec[3] - spec[1]) * 1.2)), 5)
         gif_frame = Image.new('RGBA', (112, 112), (0, 0, 0, 255))
         gif_frame.paste(img, (spec[0], spec[1]), mask=img)
         gif_frame.paste(hand, (0, int(squish * squish_translation_factor[i])), hand)
         gif_frames.append(gif_frame)
-    io = BytesIO()
-    gif_frames[0].save(io, save_all=True, format="gif",
-                       append_images=gif_frames[1:], optimize=False, duration=16, loop=0)
-    io.seek(0)
-    return io
+    return encode_gif(gif_frames, duration=16, loop=0)
 
 
 @executor
 def spin_manip(bytes: bytes) -> BytesIO:
-    return [img := PILManip.static_pil_image(bytes), f := [img.rotate(i).resize(img.size, 4) for i in range(0, 360, 5)],
-            f[0].save(io := BytesIO(), format='gif',
-                      save_all=True,
-                      append_images=f[1:],
-                      loop=0), io.seek(0), io][4]
+    img = PILManip.static_pil_image(bytes)
+    frames = [img.rotate(i).resize(img.size, 4) for i in range(0, 360, 5)]
+    # the same pixels in every frame, so one palette serves them all
+    return encode_gif(frames, loop=0, palette="shared")
 
 # Following Code by discord user z03h#6375
 # and is also AGPLv3 Licensed
@@ -786,8 +761,8 @@ def neon(byt: bytes, colors, *, multi=False, **kwargs) -> BytesIO:
 #  https://github.com/isirk
 
 
-@executor
-def quantize(byt: bytes) -> BytesIO:
+@executor(kind="stream")
+def quantize(byt: bytes) -> Iterator[bytes]:
     image = PILManip.static_pil_image(byt)
     siz = 300
     newsize = (siz, siz)
@@ -800,71 +775,61 @@ def quantize(byt: bytes) -> BytesIO:
         image = image.resize((int(w / the_key), siz)).convert("RGBA")
     else:
         image = image.resize(newsize).convert("RGBA")
-    images1 = []
-    for i in range(60):
-        try:
-            im = image.copy()
-            im = im.quantize(colors=i + 1, method=2)
-            images1.append(im)
-        except IndexError:
-            break
-    images2 = list(reversed(images1))
-    images = images1 + images2
-    buffer = BytesIO()
-    images[0].save(buffer,
-                   format='gif',
-                   save_all=True,
-                   append_images=images[1:],
-                   duration=1,
-                   loop=0)
-    buffer.seek(0)
-    return buffer
-
-
-def transfer_pixels(source_img: Image, dest_img: Image, num_pixels: int, unused):
-    todo = num_pixels
-    while todo > 0 and unused:
-        pixel_loc = unused.pop()
-        source_img.putpixel(pixel_loc, dest_img.getpixel(pixel_loc))
-        todo -= 1
-
-
-@executor
-def gen_dissolve(byt: bytes, transparent: bool) -> BytesIO:
+
+    def frames():
+        images = []
+        for i in range(60):
+            try:
+                im = image.quantize(colors=i + 1, method=2)
+            except IndexError:
+                break
+            images.append(im)
+            yield im
+        yield from reversed(images)
+
+    return stream_gif(frames(), duration=1, loop=0, local_palettes=True)
+
+
+@executor(kind="stream")
+def gen_dissolve(byt: bytes, transparent: bool) -> Iterator[bytes]:
     img = PILManip.pil_image(byt)
-    pix_to_div = ((img.height * img.width) // 25)
 
     if transparent:
-        im = Image.new("RGBA", img.size, (255,255,255,0))
+        colour = (255, 255, 255, 0)
     else:
         q = img.quantize(colors=1, method=2)
         p = q.getpalette()
-        r_tup = (p[0], p[1], p[2])
-        im = Image.new("RGBA", img.size, r_tup)
-    pixels = []
-    for x in range(img.size[0]):
-        for y in range(img.size[1]):
-            pixels.append((x, y))
-    random.shuffle(pixels)
-    images = [img.copy()]
-    while pixels:
-        transfer_pixels(img, im,pix_to_div, pixels)
-        images.append(img.copy())
-    images += images[::-1]
-    io = BytesIO()
-    images[0].save(io,
-                   format='gif',
-                   save_all=True,
-                   append_images=images[1:],
-                   duration=100,
-                   transparency=1,
-                   loop=0)
-    io.seek(0)
-    return io
+        colour = (p[0], p[1], p[2], 255)
+    fill = Image.new("RGBA", (1, 1), colour)
+    colour = np.array(colour, dtype=np.uint8).view(np.uint32)[0]
+    frame = np.array(img.convert("RGBA"))
+    # one uint32 per RGBA pixel so each step is a single scatter
+    pixels = frame.view(np.uint32).reshape(-1)
+    original = pixels.copy()
+    pix_to_div = max(1, len(pixels) // 25)
+    # one shuffle of the flat indices decides when each pixel dissolves
+    order = np.random.default_rng().permutation(len(pixels))
+    steps = range(0, len(pixels), pix_to_div)
+
+    def frames():
+        yield Image.fromarray(frame, "RGBA")
+        for start in steps:
+            pixels[order[start:start + pix_to_div]] = colour
+            yield Image.fromarray(frame, "RGBA")
+        # played back by restoring the same pixels in reverse order
+        yield Image.fromarray(frame, "RGBA")
+        for start in reversed(steps):
+            step = order[start:start + pix_to_div]
+            pixels[step] = original[step]
+            yield Image.fromarray(frame, "RGBA")
+
+    sample = [Image.fromarray(frame.copy(), "RGBA"), fill]
+    return stream_gif(frames(), duration=100, loop=0, sample=sample,
+                      transparent=transparent, palette="shared")
   
 @executor
 def shake(byt: bytes) -> BytesIO:
-    img = PILManip.pil_image(byt)
+    img = PILManip.pil_image(byt, (650, 650))
     frames = []
     img = img.convert("RGBA")
     img = img.resize((650, 650))
@@ -872,18 +837,7 @@ def shake(byt: bytes) -> BytesIO:
         base = Image.new('RGBA', (1024, 1024), (255,0,0,0))
         base.paste(img, (random.randint(170, 250), random.randint(170, 250)), mask=img)
         frames.append(base)
-    buffer = BytesIO()
-    frames[0].save(buffer,
-          format='gif', 
-          save_all= True,
-          optimize= True,
-          append_images= frames[1:], 
-          transparency=0,
-          duration= 15,
-          loop=0
-    )
-    buffer.seek(0)
-    return buffer
+    return encode_gif(frames, duration=15, loop=0)
 
 # @executor
 # def flash(byt: bytes) -> BytesIO:
@@ -910,46 +864,23 @@ def shake(byt: bytes) -> BytesIO:
 
 @executor
 def bonk(byt: bytes) -> BytesIO:
-    im = PILManip.pil_image(byt).convert("RGBA")
+    im = PILManip.pil_image(byt, (150, 150)).convert("RGBA")
     frames = []
-    up =  Image.open("app/image/assets/hammer_raised.png").convert("RGBA")
-    print(up.size)
-    down =  Image.open("app/image/assets/hammer_down.png").convert("RGBA")
+    up = assets.get("hammer_raised")
+    down = assets.get("hammer_down")
     im = im.resize((150, 150))
     up.paste(im, (100, 100), mask=im)
     frames.append(up)
     im = im.resize((150, 110))
     down.paste(im, (100, 140), mask=im)
     frames.append(down)
-    buffer = BytesIO()
-    frames[0].save(buffer,
-          format='gif', 
-          save_all= True,
-          append_images= frames[1:], 
-          duration= 150,
-          loop=0
-    )
-    buffer.seek(0)
-    return buffer
+    return encode_gif(frames, duration=150, loop=0)
 
-@executor
-def bomb(byt: bytes) -> BytesIO:
-    im = PILManip.pil_image(byt)
+@executor(kind="stream")
+def bomb(byt: bytes) -> Iterator[bytes]:
+    im = PILManip.pil_image(byt, (512, 512))
     im = im.resize((512, 512))
-    frames = [im for _ in range(50)]
-    with Image.open("app/image/assets/bomb.gif") as bomb:
-
-        for frame in ImageSequence.Iterator(bomb):
-            frames.append(frame.resize((512, 512)))
-
-    buffer = BytesIO()
-    frames[0].save(buffer,
-          format='gif', 
-          save_all= True,
-          optimize= True,
-          append_images= frames[1:], 
-          duration= 10,
-          loop=0
-    )
-    buffer.seek(0)
-    return buffer
+    explosion = assets.shared("bomb")
+    frames = itertools.chain(itertools.repeat(im, 50), explosion)
+    return stream_gif(frames, duration=10, loop=0,
+                      sample=[im, *explosion[::4]], palette="shared")
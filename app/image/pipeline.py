@@ -0,0 +1,132 @@
+import inspect
+import os
+from typing import Sequence, Tuple
+
+import numpy as np
+from matplotlib.cm import ScalarMappable
+from PIL import Image
+from wand.image import Image as WandImage
+
+from app.exceptions.errors import BadImage, ParameterError
+from app.image import numpy_manip, pil_manipulation, wand_manipulation
+from app.image.PILManip import PILManip
+from app.image.WandManip import consume_frame
+from app.image.decode_budget import plan_decode
+from app.image.decorators import executor, frame_pool
+
+PIPELINE_MAX_STEPS = int(os.getenv("PIPELINE_MAX_STEPS", 8))
+
+
+def _chainable(function) -> bool:
+    if getattr(function, "backend", None) not in ("pil", "wand", "numpy"):
+        return False
+    # steps are named without arguments, so only the image may be taken
+    return len(inspect.signature(inspect.unwrap(function)).parameters) == 1
+
+
+# the manipulations that work on one frame at a time, by name
+steps = {name: getattr(module, name)
+         for module in (pil_manipulation, wand_manipulation, numpy_manip)
+         for name in module.__all__
+         if _chainable(getattr(module, name))}
+
+
+def parse_steps(text: str) -> Tuple[str, ...]:
+    names = tuple(name.strip() for name in text.split(",") if name.strip())
+    if not 0 < len(names) <= PIPELINE_MAX_STEPS:
+        raise ParameterError(f"Pass between 1 and {PIPELINE_MAX_STEPS} "
+                             f"steps")
+    for name in names:
+        if name not in steps:
+            raise ParameterError(f"Unknown step {name}")
+    return names
+
+
+def _to_pil(frame, backend: str) -> Image:
+    if backend == "wand":
+        frame.depth = 8
+        pixels = frame.make_blob("RGBA")
+        size = frame.size
+        frame.close()
+        return Image.frombytes("RGBA", size, pixels)
+    if backend == "numpy":
+        # the same conversion plt.imsave applies to the numpy backend's
+        # results, without encoding them
+        return Image.fromarray(ScalarMappable().to_rgba(frame, bytes=True))
+    return frame
+
+
+def _from_pil(frame: Image, backend: str):
+    if backend == "pil":
+        return frame
+    if frame.mode not in ("RGB", "RGBA", "L"):
+        frame = frame.convert("RGBA")
+    if backend == "numpy":
+        return np.asarray(frame)
+    if frame.mode != "RGBA":
+        frame = frame.convert("RGBA")
+    return WandImage(blob=frame.tobytes(), format="RGBA",
+                     width=frame.width, height=frame.height, depth=8)
+
+
+def _run_chain(frame: Image, functions: Sequence) -> Image:
+    """Apply every step to one frame, converting its pixels only where
+    the chain moves to another backend."""
+    backend = "pil"
+    for function in functions:
+        if function.backend != backend:
+            frame = _from_pil(_to_pil(frame, backend), function.backend)
+            backend = function.backend
+        if backend == "wand":
+            # a step returning a new image leaves the old one to close
+            frame = consume_frame(inspect.unwrap(function), frame)
+        else:
+            frame = inspect.unwrap(function)(frame)
+    return _to_pil(frame, backend)
+
+
+def _render(image: bytes, names: Tuple[str, ...]):
+    functions = [steps[name] for name in names]
+    oversize = "reject" if any(getattr(function, "oversize", None) == "reject"
+                               for function in functions) else "downscale"
+    plan = plan_decode(image, oversize)
+    img = PILManip.pil_image(image)
+    if img.format == "GIF":
+        durations = []
+        frames = list(frame_pool.map(_run_chain,
+                                     plan.frames_of(img, durations),
+                                     functions))
+        io = PILManip.pil_gif_save(frames, durations,
+                                   img.info.get("loop", 0))
+        image_format = "gif"
+    elif img.format in ["PNG", "JPEG"]:
+        img = plan.prepare(PILManip.shrink_to(
+            img, getattr(functions[0], "size", None)))
+        plan.size = img.size
+        io = PILManip.pil_image_save(_run_chain(img, functions))
+        image_format = "png"
+    else:
+        raise BadImage("Bad Format")
+    io.processing_size = plan.processing_size
+    return io, image_format
+
+
+@executor
+def render_pipeline(image: bytes, names: Tuple[str, ...]):
+    """Run manipulations one after another over an image, encoding it
+    only once at the end."""
+    return _render(image, names)
+
+
+@executor(kind="process")
+def render_pipeline_process(image: bytes, names: Tuple[str, ...]):
+    """:func:`render_pipeline` for chains with a step that needs the
+    process pool."""
+    return _render(image, names)
+
+
+def pipeline(names: Tuple[str, ...]):
+    """The renderer for a chain, on the process pool if any step is."""
+    if any(steps[name].kind == "process" for name in names):
+        return render_pipeline_process
+    return render_pipeline
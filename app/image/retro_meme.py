@@ -1,9 +1,10 @@
 import textwrap
 
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 
 from app.image.PILManip import pil
 from app.image.decorators import executor
+from app.image.writetext import get_font, text_size
 
 __all__ = ("retromeme_gen",)
 
@@ -23,10 +24,9 @@ class Meme:
     def find_longest_line(self, text):
         longest_width = 0
         longest_line = ""
+        font = get_font(self.font_path, 20)
         for line in text:
-            width = self.draw.textsize(
-                line, font=ImageFont.truetype(self.font_path, 20)
-            )[0]
+            width = text_size(font, line)[0]
             if width > longest_width:
                 longest_width = width
                 longest_line = line
@@ -35,8 +35,8 @@ class Meme:
 
     def get_font_measures(self, text, font_size, ratio):
         measures = {}
-        measures["font"] = ImageFont.truetype(self.font_path, size=font_size)
-        measures["width"] = self.draw.textsize(text, font=measures["font"])[0]
+        measures["font"] = get_font(self.font_path, font_size)
+        measures["width"] = text_size(measures["font"], text)[0]
         measures["ratio"] = measures["width"] / float(self.image.width)
         measures["ratio_diff"] = abs(ratio - measures["ratio"])
 
@@ -82,7 +82,7 @@ class Meme:
             ratio = measures[closer]["ratio"]
             font = measures[closer]["font"]
 
-        width = self.draw.textsize(longest_text_line, font=font)[0]
+        width = text_size(font, longest_text_line)[0]
 
         return font, width
 
@@ -1,12 +1,13 @@
 import random
 from datetime import datetime
 
-from PIL import Image, ImageDraw, ImageFont, ImageOps
+from PIL import Image, ImageDraw, ImageOps
 
 from app.exceptions.errors import ParameterError
 from app.image.PILManip import static_pil
+from app.image.asset_registry import assets
 from app.image.decorators import executor
-from app.image.writetext import WriteText
+from app.image.writetext import WriteText, get_font
 
 __all__ = (
     "tweet_gen",
@@ -16,14 +17,19 @@ __all__ = (
     "yt_comment"
 )
 
+assets.register("captcha", "captcha.png", mode="RGBA")
+assets.register("tweet", "tweet.png", mode="RGBA")
+assets.register("yt-dark", "yt-dark.png", mode="RGBA")
+assets.register("yt-light", "yt-light.png", mode="RGBA")
+
 
 @executor
-@static_pil
+@static_pil(size=(765, 780))
 def captcha(img, text: str):
     if len(text) > 30:
         raise ParameterError("text should be less than 30 characters")
     im = img.convert("RGBA").resize((765, 780))
-    base = Image.open("app/image/assets/captcha.png").convert("RGBA")
+    base = assets.get("captcha")
     base.paste(im, (15, 240), im)
     im = ImageDraw.Draw(base)
     for y in range(240, 1020, 195):
@@ -37,7 +43,7 @@ def captcha(img, text: str):
 
 
 @executor
-@static_pil
+@static_pil(size=(150, 150))
 def tweet_gen(image, username: str, text: str):
     if len(text) > 180:
         raise ParameterError("Text supplied is too long")
@@ -66,7 +72,7 @@ def tweet_gen(image, username: str, text: str):
         su = "AM"
     y = str(today.day).strip("0")
     t_string = f"{h}:{today.minute} {su} - {y} {mo} {today.year}"
-    tweet = Image.open("app/image/assets/tweet.png").convert("RGBA")
+    tweet = assets.get("tweet")
     st = username
     lst = st.lower()
     to_pa = image.resize((150, 150), 5)
@@ -77,9 +83,9 @@ def tweet_gen(image, username: str, text: str):
     avatar = ImageOps.fit(to_pa, mask.size, centering=(0.5, 0.5))
     tweet.paste(avatar, (20, 20), mask=mask)
     d = ImageDraw.Draw(tweet)
-    fntna = ImageFont.truetype("app/image/assets/HelveticaNeue Medium.ttf", 25)
-    fnth = ImageFont.truetype("app/image/assets/HelveticaNeue Light.ttf", 25)
-    fntt = ImageFont.truetype("app/image/assets/HelveticaNeue Light.ttf", 18)
+    fntna = get_font("app/image/assets/HelveticaNeue Medium.ttf", 25)
+    fnth = get_font("app/image/assets/HelveticaNeue Light.ttf", 25)
+    fntt = get_font("app/image/assets/HelveticaNeue Light.ttf", 18)
     d.multiline_text((140, 35), st, font=fntna, fill=(0, 0, 0))
     d.multiline_text((143, 60),
                      f"@{lst}",
@@ -126,12 +132,11 @@ def motiv(img, top_text: str, bottom_text: str):
 
 
 @executor
-@static_pil
+@static_pil(size=(150, 150))
 def yt_comment(image, username: str, text: str, dark: bool):
     bg = (24, 24, 24) if dark else (249, 249, 249)
     im = Image.new("RGBA", (800, 800), bg)
-    com_com = "yt-dark.png" if dark else "yt-light.png"
-    com = Image.open(f"app/image/assets/{com_com}").convert("RGBA")
+    com = assets.shared("yt-dark" if dark else "yt-light")
     to_pa = image.resize((150, 150), 5)
     size = (75, 75)
     mask = Image.new("L", size, 0)
@@ -140,12 +145,11 @@ def yt_comment(image, username: str, text: str, dark: bool):
     avatar = ImageOps.fit(to_pa, mask.size, centering=(0.5, 0.5))
     im.paste(avatar, (100, 100), mask=mask)
     d = ImageDraw.Draw(im)
-    fn_name = ImageFont.truetype("app/image/assets/Roboto-Medium.ttf", size=25)
+    fn_name = get_font("app/image/assets/Roboto-Medium.ttf", 25)
     t_c = (255, 255, 255) if dark else (3, 3, 3)
     d.text((190, 100), username, fill=t_c, font=fn_name)
     buff = fn_name.getsize(username)[0] + 190 + 10
-    fn_time = ImageFont.truetype("app/image/assets/Roboto-Regular.ttf",
-                                 size=15)
+    fn_time = get_font("app/image/assets/Roboto-Regular.ttf", 15)
     num = random.randint(2, 60)
     period = random.choice(["seconds", "minutes", "days"])
     d.text((buff, 108), f"{num} {period} ago", fill=(96, 96, 96), font=fn_time)
@@ -157,7 +161,7 @@ def yt_comment(image, username: str, text: str, dark: bool):
 
 
 @executor
-@static_pil
+@static_pil(size=(150, 150))
 def quote(image, username: str, text: str, dark: bool):
     today = datetime.today()
     bg = (54, 57, 63) if dark else (256, 256, 256)
@@ -177,8 +181,8 @@ def quote(image, username: str, text: str, dark: bool):
         su = "AM"
     t_string = f"Today at {h}:{today.minute} {su}"
     d = ImageDraw.Draw(y)
-    fntd = ImageFont.truetype("app/image/assets/whitney-semibold.ttf", 60)
-    fntt = ImageFont.truetype("app/image/assets/whitney-medium.ttf", 30)
+    fntd = get_font("app/image/assets/whitney-semibold.ttf", 60)
+    fntt = get_font("app/image/assets/whitney-medium.ttf", 30)
     if len(text) > 1000:
         raise ParameterError("text too long")
     else:
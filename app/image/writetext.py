@@ -4,9 +4,165 @@ Copyright 2011 Álvaro Justen [alvarojusten at gmail dot com]
 License: GPL <http://www.gnu.org/copyleft/gpl.html>
 With modifications by Daggy1234 (dagggy@daggy.tech)
 """
+import functools
+from typing import List, Optional, Tuple
+
 from PIL import Image, ImageDraw, ImageFont
 
 
+@functools.lru_cache(maxsize=256)
+def get_font(font_filename, font_size) -> ImageFont.FreeTypeFont:
+    """Load a font once per process for each path and size."""
+    return ImageFont.truetype(font_filename, font_size)
+
+
+@functools.lru_cache(maxsize=8192)
+def text_size(font: ImageFont.FreeTypeFont, text):
+    """Memoized ``font.getsize``, fonts are keyed by identity, which is
+    stable because they come from :func:`get_font`."""
+    return font.getsize(text)
+
+
+class TextLayout:
+    """Text broken into lines that fit a box, measured once.
+
+    ``lines`` holds ``(text, width)`` pairs for each line. A layout does
+    not depend on where it is drawn, so it can be drawn repeatedly, at
+    several positions or onto several frames.
+    """
+
+    def __init__(self, font: ImageFont.FreeTypeFont,
+                 lines: List[Tuple[str, int]], line_height: int,
+                 box_width: int):
+        self.font = font
+        self.lines = lines
+        self.line_height = line_height
+        self.box_width = box_width
+
+    @property
+    def height(self) -> int:
+        return self.line_height * len(self.lines) + \
+            int(text_size(self.font, "text")[1] * 1.5)
+
+    def boxes(self, x, y, place="left"):
+        """Yield ``(x, y, text, width)`` for each line drawn at x, y."""
+        for text, width in self.lines:
+            y += self.line_height
+            if place == "right":
+                line_x = x + self.box_width - width
+            elif place == "center":
+                line_x = int(x + ((self.box_width - width) / 2))
+            else:
+                line_x = x
+            yield line_x, y, text, width
+
+    def draw(self, draw: ImageDraw.ImageDraw, x, y, color, place="left",
+             justify_last_line=False) -> int:
+        """Draw the layout with its top left corner at x, y and return
+        the y coordinate below the text, as ``write_text_box`` does."""
+        height = y
+        for index, (line_x, height, text, _width) in enumerate(
+                self.boxes(x, y, place)):
+            words = text.split()
+            if place != "justify" or len(words) == 1 or (
+                    index == len(self.lines) - 1 and not justify_last_line):
+                draw.text((line_x, height), text, font=self.font, fill=color)
+                continue
+            total_size = text_size(self.font, "".join(words))
+            space_width = (self.box_width - total_size[0]) / (len(words) - 1.0)
+            start_x = x
+            for word in words[:-1]:
+                draw.text((start_x, height), word, font=self.font, fill=color)
+                start_x += text_size(self.font, word)[0] + space_width
+            last_word_x = x + self.box_width - text_size(self.font,
+                                                         words[-1])[0]
+            draw.text((last_word_x, height), words[-1], font=self.font,
+                      fill=color)
+        return height + int(text_size(self.font, "text")[1] * 1.5)
+
+
+def _gap_width(font: ImageFont.FreeTypeFont, left: str, right: str) -> int:
+    # how much wider "a b" is than "a" and "b" side by side, taking the
+    # space, kerning and glyph bearings around the join into account
+    return text_size(font, f"{left} {right}")[0] - text_size(font, left)[0] \
+        - text_size(font, right)[0]
+
+
+@functools.lru_cache(maxsize=256)
+def layout_text(text: str, font_filename, font_size,
+                box_width) -> TextLayout:
+    """Greedily break ``text`` into lines no wider than ``box_width``.
+
+    Every word is measured once and line widths are accumulated from
+    word widths plus the width of the gap between neighbouring words,
+    rather than measuring the whole line again for every word. Each line
+    is joined once, when it is finished.
+    """
+    font = get_font(font_filename, font_size)
+    lines = []
+    line = []
+    line_width = 0
+    # the words of the last candidate line, whose height spaces the lines
+    measured = []
+    for word in text.split():
+        word_width = text_size(font, word)[0]
+        if not line:
+            line = measured = [word]
+            line_width = word_width
+            continue
+        width = line_width + _gap_width(font, line[-1][-1], word[0]) + \
+            word_width
+        if width <= box_width:
+            line.append(word)
+            line_width = width
+            measured = line
+        else:
+            lines.append(" ".join(line))
+            measured = [lines[-1], word]
+            line = [word]
+            line_width = word_width
+    if line:
+        lines.append(" ".join(line))
+    # rounding in the accumulated widths can be a pixel off, so each
+    # finished line is measured once for aligning it
+    lines = [(line, text_size(font, line)[0]) for line in lines]
+    line_height = text_size(font, " ".join(measured))[1] if measured else 0
+    return TextLayout(font, lines, line_height, box_width)
+
+
+def fit_font_size(text, font_filename, max_width: Optional[int] = None,
+                  max_height: Optional[int] = None) -> int:
+    """The largest font size that keeps ``text`` under the given limits."""
+    if max_width is None and max_height is None:
+        raise ValueError("You need to pass max_width or max_height")
+
+    def measure(font_size):
+        return text_size(get_font(font_filename, font_size), text)
+
+    def fits(font_size):
+        width, height = measure(font_size)
+        too_wide = max_width is not None and width >= max_width
+        too_tall = max_height is not None and height >= max_height
+        return not (too_wide or too_tall)
+
+    size = measure(1)
+    if (max_width is not None and size[0] > max_width) or (
+            max_height is not None and size[1] > max_height):
+        raise ValueError("Text can't be filled in only (%dpx, %dpx)" % size)
+    if not fits(1):
+        return 0
+    low, high = 1, 2
+    while fits(high):
+        low, high = high, high * 2
+    while high - low > 1:
+        middle = (low + high) // 2
+        if fits(middle):
+            low = middle
+        else:
+            high = middle
+    return low
+
+
 class WriteText(object):
     def __init__(self, im: Image):
         self.image = im
@@ -17,22 +173,7 @@ class WriteText(object):
         return self.image
 
     def get_font_size(self, text, font, max_width, max_height):
-        if max_width is None and max_height is None:
-            raise ValueError("You need to pass max_width or max_height")
-        font_size = 1
-        text_size = self.get_text_size(font, font_size, text)
-        if (max_width is not None and text_size[0] > max_width) or (
-                max_height is not None and text_size[1] > max_height
-        ):
-            raise ValueError(
-                "Text can't be filled in only (%dpx, %dpx)" % text_size)
-        while True:
-            if (max_width is not None and text_size[0] >= max_width) or (
-                    max_height is not None and text_size[1] >= max_height
-            ):
-                return font_size - 1
-            font_size += 1
-            text_size = self.get_text_size(font, font_size, text)
+        return fit_font_size(text, font, max_width, max_height)
 
     def write_text(
             self,
@@ -51,7 +192,7 @@ class WriteText(object):
             font_size = self.get_font_size(text, font_filename, max_width,
                                            max_height)
         text_size = self.get_text_size(font_filename, font_size, text)
-        font = ImageFont.truetype(font_filename, font_size)
+        font = get_font(font_filename, font_size)
         if x == "center":
             x = (self.size[0] - text_size[0]) / 2
         if y == "center":
@@ -61,8 +202,7 @@ class WriteText(object):
 
     @staticmethod
     def get_text_size(font_filename, font_size, text):
-        font = ImageFont.truetype(font_filename, font_size)
-        return font.getsize(text)
+        return text_size(get_font(font_filename, font_size), text)
 
     def write_text_box(
             self,
@@ -76,74 +216,6 @@ class WriteText(object):
             place="left",
             justify_last_line=False,
     ):
-        lines = []
-        line = []
-        words = text.split()
-        for word in words:
-            new_line = " ".join(line + [word])
-            size = self.get_text_size(font_filename, font_size, new_line)
-            text_height = size[1]
-            if size[0] <= box_width:
-                line.append(word)
-            else:
-                lines.append(line)
-                line = [word]
-        if line:
-            lines.append(line)
-        lines = [" ".join(line) for line in lines if line]
-        height = y
-        for index, line in enumerate(lines):
-            height += text_height
-            if place == "left":
-                self.write_text(x, height, line, font_filename, font_size,
-                                color=color)
-            elif place == "right":
-                total_size = self.get_text_size(font_filename, font_size, line)
-                x_left = x + box_width - total_size[0]
-                self.write_text(
-                    x_left, height, line, font_filename, font_size, color=color
-                )
-            elif place == "center":
-                total_size = self.get_text_size(font_filename, font_size, line)
-                x_left = int(x + ((box_width - total_size[0]) / 2))
-                self.write_text(
-                    x_left, height, line, font_filename, font_size, color=color
-                )
-            elif place == "justify":
-                words = line.split()
-                if (index == len(lines) - 1 and not justify_last_line) or len(
-                        words
-                ) == 1:
-                    self.write_text(
-                        x, height, line, font_filename, font_size, color=color
-                    )
-                    continue
-                line_without_spaces = "".join(words)
-                total_size = self.get_text_size(
-                    font_filename, font_size, line_without_spaces
-                )
-                space_width = (box_width - total_size[0]) / (len(words) - 1.0)
-                start_x = x
-                for word in words[:-1]:
-                    self.write_text(
-                        start_x, height, word, font_filename, font_size,
-                        color=color
-                    )
-                    word_size = self.get_text_size(font_filename, font_size,
-                                                   word)
-                    start_x += word_size[0] + space_width
-                last_word_size = self.get_text_size(font_filename, font_size,
-                                                    words[-1])
-                last_word_x = x + box_width - last_word_size[0]
-
-                self.write_text(
-                    last_word_x,
-                    height,
-                    words[-1],
-                    font_filename,
-                    font_size,
-                    color=color,
-                )
-        fsizee = self.get_text_size(font_filename, font_size, 'text')
-        height += int(fsizee[1] * 1.5)
-        return height
+        layout = layout_text(text, font_filename, font_size, box_width)
+        return layout.draw(self.draw, x, y, color, place=place,
+                           justify_last_line=justify_last_line)
@@ -1,2 +1,3 @@
-from .auth import auth_check
-from .timer import add_process_time_header
+from .auth import AuthMiddleware
+from .metrics import PrometheusMiddleware
+from .timer import ProcessTimeMiddleware
@@ -1,44 +1,54 @@
-from fastapi import Request
 from fastapi.responses import JSONResponse
-from starlette.background import BackgroundTasks
-
-from app.utils.client import Client
-
-
-async def post_stat(route: str, token: str, ua: str):
-    await Client.post_stat(route, token, ua)
-
-
-async def auth_check(request: Request, call_next):
-    if (request.url.path == "/") or (request.url.path == "/metrics/") or \
-            (request.url.path == "/docs") or \
-            (request.url.path == "/openapi.json") or \
-            (request.url.path == "/image/openapi.json") or \
-            (request.url.path == "/playground"):
-        response = await call_next(request)
-        return response
-    else:
-        try:
-            token = request.headers["Authorization"]
-        except KeyError:
-            return JSONResponse({"message": "Unauthorized"}, status_code=403)
-
-        tok = await Client.auth(token)
-        if tok.auth:
-            if not tok.ratelimited:
-                response = await call_next(request)
-                response.headers["X-Ratelimit-Limit"] = str(tok.ratelimit)
-                response.headers['X-Ratelimit-Remaining'] = str(tok.left)
-                t = BackgroundTasks()
-                try:
-                    ua = request.headers.get("user-agent")
-                except KeyError:
-                    ua = "No User Agent"
-                t.add_task(post_stat, route=request.url.path, token=token, ua=ua)
-                response.background = t
-                return response
-            return JSONResponse({"message": "Ratelimited"}, headers={'X-Ratelimit-Limit': str(tok.ratelimit),
-                                                                     'X-Ratelimit-Remaining': str(tok.left)},
-                                status_code=429)
-
-        return JSONResponse({"message": "Unauthorized"}, status_code=403)
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.utils.auth_cache import auth_cache
+from app.utils.stats import stat_buffer
+
+PUBLIC_PATHS = ("/", "/metrics/", "/docs", "/openapi.json",
+                "/image/openapi.json", "/playground")
+
+
+class AuthMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] in PUBLIC_PATHS:
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        token = headers.get("Authorization")
+        if token is None:
+            response = JSONResponse({"message": "Unauthorized"},
+                                    status_code=403)
+            await response(scope, receive, send)
+            return
+
+        tok = await auth_cache.get(token)
+        if not tok.auth:
+            response = JSONResponse({"message": "Unauthorized"},
+                                    status_code=403)
+        elif tok.ratelimited:
+            response = JSONResponse({"message": "Ratelimited"}, headers={'X-Ratelimit-Limit': str(tok.ratelimit),
+                                                                         'X-Ratelimit-Remaining': str(tok.left)},
+                                    status_code=429)
+        else:
+            auth_cache.consume(tok)
+            await self.app(scope, receive, self.ratelimit_headers(send, tok))
+            ua = headers.get("user-agent", "No User Agent")
+            stat_buffer.add(scope["path"], token, ua)
+            return
+        await response(scope, receive, send)
+
+    @staticmethod
+    def ratelimit_headers(send: Send, tok) -> Send:
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                headers = MutableHeaders(scope=message)
+                headers["X-Ratelimit-Limit"] = str(tok.ratelimit)
+                headers["X-Ratelimit-Remaining"] = str(tok.left)
+            await send(message)
+
+        return send_wrapper
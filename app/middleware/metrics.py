@@ -0,0 +1,60 @@
+import time
+
+from starlette.routing import Match
+from starlette.status import HTTP_500_INTERNAL_SERVER_ERROR
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from starlette_prometheus.middleware import (EXCEPTIONS, REQUESTS,
+                                             REQUESTS_IN_PROGRESS,
+                                             REQUESTS_PROCESSING_TIME,
+                                             RESPONSES)
+
+
+def get_path_template(scope: Scope) -> str:
+    for route in scope["app"].routes:
+        match, _child_scope = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return scope["path"]
+
+
+class PrometheusMiddleware:
+    """Records the starlette_prometheus request metrics without buffering
+    the response body."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        path_template = get_path_template(scope)
+        status_code = HTTP_500_INTERNAL_SERVER_ERROR
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_PROGRESS.labels(method=method,
+                                    path_template=path_template).inc()
+        REQUESTS.labels(method=method, path_template=path_template).inc()
+        before_time = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            status_code = HTTP_500_INTERNAL_SERVER_ERROR
+            EXCEPTIONS.labels(method=method, path_template=path_template,
+                              exception_type=type(e).__name__).inc()
+            raise
+        else:
+            REQUESTS_PROCESSING_TIME.labels(
+                method=method, path_template=path_template).observe(
+                time.perf_counter() - before_time)
+        finally:
+            RESPONSES.labels(method=method, path_template=path_template,
+                             status_code=status_code).inc()
+            REQUESTS_IN_PROGRESS.labels(method=method,
+                                        path_template=path_template).dec()
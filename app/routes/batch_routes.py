@@ -0,0 +1,169 @@
+import asyncio
+import json
+import logging
+import os
+import urllib.parse
+import zipfile
+from io import BytesIO
+from typing import Any, Dict, List, Tuple
+
+from fastapi import APIRouter, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+from app.exceptions.errors import DagpiException, ParameterError
+from app.routes import image_routes
+from app.routes.responses import ImageResponse, responses
+from app.routes.sources import image_source
+from app.utils.client import Client
+
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", 25))
+# images of one batch rendered at a time, the rest wait their turn
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 4))
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+def _takes_one_image(route) -> bool:
+    return any(dependency.call is image_source
+               for dependency in route.dependant.dependencies)
+
+
+# every single image route, by its path without slashes
+effects = {route.path.strip("/"): route
+           for route in image_routes.router.routes
+           if "POST" in route.methods and _takes_one_image(route)}
+
+
+class BatchRequest(BaseModel):
+    effect: str
+    urls: List[str]
+    params: Dict[str, Any] = {}
+
+
+def _query(params: Dict[str, Any]) -> bytes:
+    """``params`` as the query string of a request to the effect."""
+    pairs = []
+    for name, value in params.items():
+        for item in value if isinstance(value, list) else [value]:
+            if isinstance(item, bool):
+                item = str(item).lower()
+            pairs.append((name, str(item)))
+    return urllib.parse.urlencode(pairs).encode("latin-1")
+
+
+async def _call(request: Request, route, query: bytes,
+                byt: bytes) -> Tuple[int, str, bytes]:
+    """Send ``byt`` to the effect's route as an uploaded image, the way
+    a POST to it would, and collect its response."""
+    scope = {**request.scope, "method": "POST", "path": route.path,
+             "raw_path": route.path.encode("latin-1"),
+             "query_string": query,
+             "headers": [(b"content-type", b"application/octet-stream"),
+                         (b"content-length", str(len(byt)).encode())]}
+    sent = False
+    status, media_type, body = 500, "", bytearray()
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {"type": "http.disconnect"}
+        sent = True
+        return {"type": "http.request", "body": byt, "more_body": False}
+
+    async def send(message):
+        nonlocal status, media_type
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            for name, value in message.get("headers", []):
+                if name.lower() == b"content-type":
+                    media_type = value.decode("latin-1").split(";")[0]
+        elif message["type"] == "http.response.body":
+            body.extend(message.get("body", b""))
+
+    await route.app(scope, receive, send)
+    return status, media_type, bytes(body)
+
+
+async def _error(request: Request, exc: Exception) -> Dict[str, Any]:
+    if isinstance(exc, DagpiException):
+        for cls in type(exc).__mro__:
+            handler = request.app.exception_handlers.get(cls)
+            if handler is not None:
+                response = await handler(request, exc)
+                return {"status": response.status_code,
+                        "message": json.loads(response.body)["message"]}
+    logger.error("Batch image failed", exc_info=exc)
+    return {"status": 500, "message": "Internal server error"}
+
+
+def _refused(status: int, body: bytes) -> Dict[str, Any]:
+    try:
+        content = json.loads(body)
+    except ValueError:
+        content = {}
+    message = content.get("message", content.get("detail", "Failed"))
+    return {"status": status, "message": message}
+
+
+def _archive(images: List[Tuple[str, bytes]], failed: List[Dict]) -> BytesIO:
+    io = BytesIO()
+    # the images are already compressed, so they are stored as they are
+    with zipfile.ZipFile(io, "w", zipfile.ZIP_STORED) as archive:
+        for name, body in images:
+            archive.writestr(name, body)
+        archive.writestr("errors.json", json.dumps(failed))
+    io.seek(0)
+    return io
+
+
+@router.post("/batch/", responses={**responses, "200": {
+    "content": {"application/zip": {}}}})
+async def batch(request: Request, batch_request: BatchRequest):
+    """Apply one effect to many images, returned together as a zip.
+
+    Images are named by their position in ``urls``. Images that could not
+    be downloaded or rendered are left out and listed in ``errors.json``
+    with the status and message their own request would have got.
+    """
+    route = effects.get(batch_request.effect)
+    if route is None:
+        raise ParameterError(f"Unknown effect {batch_request.effect}")
+    if not 0 < len(batch_request.urls) <= BATCH_MAX_IMAGES:
+        raise ParameterError(f"Pass between 1 and {BATCH_MAX_IMAGES} urls")
+    query = _query(batch_request.params)
+    turns = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def render(url: str):
+        byt = await Client.image_bytes(url)
+        async with turns:
+            return await _call(request, route, query, byt)
+
+    results = await asyncio.gather(
+        *(render(url) for url in batch_request.urls), return_exceptions=True)
+    # every image gets the same params, so if they are invalid for one
+    # they are for all of them
+    for result in results:
+        if isinstance(result, RequestValidationError):
+            raise result
+    images = []
+    failed = []
+    for index, (url, result) in enumerate(zip(batch_request.urls, results)):
+        if isinstance(result, asyncio.CancelledError):
+            raise result
+        if isinstance(result, Exception):
+            failed.append({"index": index, "url": url,
+                           **await _error(request, result)})
+            continue
+        status, media_type, body = result
+        if status != 200:
+            failed.append({"index": index, "url": url,
+                           **_refused(status, body)})
+            continue
+        images.append((f"{index}.{media_type.split('/')[-1]}", body))
+    io = await run_in_threadpool(_archive, images, failed)
+    return ImageResponse(io, media_type="application/zip", headers={
+        "Content-Disposition":
+            f'attachment; filename="{batch_request.effect}.zip"'})
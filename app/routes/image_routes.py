@@ -1,4 +1,7 @@
-from fastapi import APIRouter, Response
+from typing import List
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
 
 from app.image.numpy_manip import *
 from app.image.pil_manipulation import *
@@ -6,458 +9,427 @@ from app.image.retro_meme import *
 from app.image.text_images import *
 from app.image.polaroid_manip import glitch
 from app.image.wand_manipulation import *
-from app.routes.responses import (gif_response_only, normal_response,
-                                  static_response_only)
-from app.utils.client import Client
+from app.image.pipeline import parse_steps, pipeline
+from app.routes.responses import (ImageResponse, gif_response_only,
+                                  normal_response, static_response_only)
+from app.routes.sources import image_pair, image_source
+from app.utils.cache import cached
 
 router = APIRouter()
 
 
-@router.get("/colors/", responses=static_response_only)
-async def color_image(url: str):
-    byt = await Client.image_bytes(url)
-    img = await top5colors(byt)
-    return Response(img.read(), media_type="image/png")
+def image_route(path: str, **kwargs):
+    """GET takes the image as ``url``, POST also accepts it uploaded.
+
+    The two are registered as separate routes, the POST one named after
+    the endpoint with ``_upload``, so each has an operation id of its own.
+    """
+
+    def decorate(endpoint):
+        router.get(path, **kwargs)(endpoint)
+        router.post(path, name=f"{endpoint.__name__}_upload",
+                    **kwargs)(endpoint)
+        return endpoint
+
+    return decorate
 
 
-@router.get("/retromeme/", responses=static_response_only)
-async def retro_meme(url: str, top_text: str, bottom_text: str):
-    byt = await Client.image_bytes(url)
+@image_route("/colors/", responses=static_response_only)
+async def color_image(byt: bytes = Depends(image_source)):
+    img = await cached(top5colors, byt)
+    return ImageResponse(img, media_type="image/png")
+
+
+@image_route("/retromeme/", responses=static_response_only)
+async def retro_meme(top_text: str, bottom_text: str,
+                     byt: bytes = Depends(image_source)):
     text = top_text + "| " + bottom_text
-    img, image_format = await retromeme_gen(byt, text)
-    return Response(img.read(), media_type=f"image/{image_format}")
+    img, image_format = await cached(retromeme_gen, byt, text)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/motiv/", responses=static_response_only)
-async def motiv_meme(url: str, top_text: str, bottom_text: str):
-    byt = await Client.image_bytes(url)
-    img = await motiv(byt, top_text, bottom_text)
-    return Response(img.read(), media_type="image/png")
+@image_route("/motiv/", responses=static_response_only)
+async def motiv_meme(top_text: str, bottom_text: str,
+                     byt: bytes = Depends(image_source)):
+    img = await cached(motiv, byt, top_text, bottom_text)
+    return ImageResponse(img, media_type="image/png")
 
 
-@router.get("/modernmeme/", responses=normal_response)
-async def modern_meme(url: str, text: str):
-    byt = await Client.image_bytes(url)
-    img, image_format = await memegen(byt, text)
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/modernmeme/", responses=normal_response)
+async def modern_meme(text: str, byt: bytes = Depends(image_source)):
+    img, image_format = await cached(memegen, byt, text)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/triggered/", responses=gif_response_only)
-async def trigger_image(url: str):
-    byt = await Client.image_bytes(url)
+@image_route("/triggered/", responses=gif_response_only)
+async def trigger_image(byt: bytes = Depends(image_source)):
     img = await triggered(byt)
-    return Response(img.read(), media_type="image/gif")
+    return ImageResponse(img, media_type="image/gif")
+
+
+@image_route("/wasted/", responses=normal_response)
+async def wasted_image(byt: bytes = Depends(image_source)):
+    chain = ("grayscale", "wasted")
+    img, image_format = await cached(pipeline(chain), byt, chain)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/wasted/", responses=normal_response)
-async def wasted_image(url: str):
-    byt = await Client.image_bytes(url)
-    img, _image_format = await grayscale(byt)
-    img, image_format = await wasted(img.read())
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/pipeline/", responses=normal_response)
+async def pipeline_image(steps: str, byt: bytes = Depends(image_source)):
+    chain = parse_steps(steps)
+    img, image_format = await cached(pipeline(chain), byt, chain)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/5g1g/", responses=static_response_only)
-async def get_5g1g(url: str, url2: str):
-    byt = await Client.image_bytes(url)
-    byt_b = await Client.image_bytes(url2)
-    img = await five_guys_one_girl(byt, byt_b)
-    return Response(img.read(), media_type="image/png")
+@image_route("/5g1g/", responses=static_response_only)
+async def get_5g1g(sources: List[bytes] = Depends(image_pair)):
+    byt, byt_b = sources
+    img = await cached(five_guys_one_girl, byt, byt_b)
+    return ImageResponse(img, media_type="image/png")
 
 
-@router.get("/whyareyougay/", responses=static_response_only)
-async def get_why_are_you_gay(url: str, url2: str):
-    byt = await Client.image_bytes(url)
-    byt_b = await Client.image_bytes(url2)
-    img = await why_are_you_gay(byt, byt_b)
-    return Response(img.read(), media_type="image/png")
+@image_route("/whyareyougay/", responses=static_response_only)
+async def get_why_are_you_gay(sources: List[bytes] = Depends(image_pair)):
+    byt, byt_b = sources
+    img = await cached(why_are_you_gay, byt, byt_b)
+    return ImageResponse(img, media_type="image/png")
   
 
-@router.get("/slap/", responses=static_response_only)
-async def slap_image(url: str, url2: str):
-    byt = await Client.image_bytes(url)
-    byt_b = await Client.image_bytes(url2)
-    img = await slap(byt, byt_b)
-    return Response(img.read(), media_type="image/png")
+@image_route("/slap/", responses=static_response_only)
+async def slap_image(sources: List[bytes] = Depends(image_pair)):
+    byt, byt_b = sources
+    img = await cached(slap, byt, byt_b)
+    return ImageResponse(img, media_type="image/png")
 
 
-@router.get("/invert/", responses=normal_response)
-async def invert_image(url: str):
-    byt = await Client.image_bytes(url)
-    img, image_format = await invert(byt)
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/invert/", responses=normal_response)
+async def invert_image(byt: bytes = Depends(image_source)):
+    img, image_format = await cached(invert, byt)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/sobel/", responses=static_response_only)
-async def sobel_image(url: str):
-    byt = await Client.image_bytes(url)
-    img = await get_sobel(byt)
-    return Response(img.read(), media_type="image/png")
+@image_route("/sobel/", responses=static_response_only)
+async def sobel_image(byt: bytes = Depends(image_source)):
+    img = await cached(get_sobel, byt)
+    return ImageResponse(img, media_type="image/png")
 
 
-@router.get("/hog/", responses=static_response_only)
-async def hog_image(url: str):
-    byt = await Client.image_bytes(url)
-    img = await hog_process(byt)
-    return Response(img.read(), media_type="image/png")
+@image_route("/hog/", responses=static_response_only)
+async def hog_image(byt: bytes = Depends(image_source)):
+    img = await cached(hog_process, byt)
+    return ImageResponse(img, media_type="image/png")
 
 
-@router.get("/triangle/", responses=static_response_only)
-async def triange(url: str):
-    byt = await Client.image_bytes(url)
-    img = await triangle_manip(byt)
-    return Response(img.read(), media_type="image/png")
+@image_route("/triangle/", responses=static_response_only)
+async def triange(byt: bytes = Depends(image_source)):
+    img = await cached(triangle_manip, byt)
+    return ImageResponse(img, media_type="image/png")
 
 
-@router.get("/blur/", responses=normal_response)
-async def blur_image(url: str):
-    byt = await Client.image_bytes(url)
-    img, image_format = await blur(byt)
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/blur/", responses=normal_response)
+async def blur_image(byt: bytes = Depends(image_source)):
+    img, image_format = await cached(blur, byt)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/rgb/", responses=static_response_only)
-async def rgb_image(url: str):
-    byt = await Client.image_bytes(url)
-    img = await rgb_graph(byt)
-    return Response(img.read(), media_type="image/png")
+@image_route("/rgb/", responses=static_response_only)
+async def rgb_image(byt: bytes = Depends(image_source)):
+    img = await cached(rgb_graph, byt)
+    return ImageResponse(img, media_type="image/png")
 
 
-@router.get("/angel/", responses=normal_response)
-async def angel_image(url: str):
-    byt = await Client.image_bytes(url)
-    img, image_format = await angel(byt)
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/angel/", responses=normal_response)
+async def angel_image(byt: bytes = Depends(image_source)):
+    img, image_format = await cached(angel, byt)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/satan/", responses=normal_response)
-async def sat_image(url: str):
-    byt = await Client.image_bytes(url)
-    img, image_format = await satan(byt)
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/satan/", responses=normal_response)
+async def sat_image(byt: bytes = Depends(image_source)):
+    img, image_format = await cached(satan, byt)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/hitler/", responses=normal_response)
-async def hit_image(url: str):
-    byt = await Client.image_bytes(url)
-    img, image_format = await htiler(byt)
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/hitler/", responses=normal_response)
+async def hit_image(byt: bytes = Depends(image_source)):
+    img, image_format = await cached(htiler, byt)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/obama/", responses=normal_response)
-async def obama_image(url: str):
-    byt = await Client.image_bytes(url)
-    img, image_format = await obama(byt)
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/obama/", responses=normal_response)
+async def obama_image(byt: bytes = Depends(image_source)):
+    img, image_format = await cached(obama, byt)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/wanted/", responses=normal_response)
-async def wanted_image(url: str):
-    byt = await Client.image_bytes(url)
-    img, image_format = await wanted(byt)
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/wanted/", responses=normal_response)
+async def wanted_image(byt: bytes = Depends(image_source)):
+    img, image_format = await cached(wanted, byt)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/shatter/", responses=normal_response)
-async def shatter_image(url: str):
-    byt = await Client.image_bytes(url)
-    img, image_format = await shatter(byt)
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/shatter/", responses=normal_response)
+async def shatter_image(byt: bytes = Depends(image_source)):
+    img, image_format = await cached(shatter, byt)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/bad/", responses=normal_response)
-async def bad_image(url: str):
-    byt = await Client.image_bytes(url)
-    img, image_format = await bad_img(byt)
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/bad/", responses=normal_response)
+async def bad_image(byt: bytes = Depends(image_source)):
+    img, image_format = await cached(bad_img, byt)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/sith/", responses=normal_response)
-async def sith_image(url: str):
-    byt = await Client.image_bytes(url)
-    img, image_format = await sithlord(byt)
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/sith/", responses=normal_response)
+async def sith_image(byt: bytes = Depends(image_source)):
+    img, image_format = await cached(sithlord, byt)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/jail/", responses=normal_response)
-async def jail_image(url: str):
-    byt = await Client.image_bytes(url)
-    img, image_format = await jail(byt)
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/jail/", responses=normal_response)
+async def jail_image(byt: bytes = Depends(image_source)):
+    img, image_format = await cached(jail, byt)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/gay/", responses=normal_response)
-async def gay_image(url: str):
-    byt = await Client.image_bytes(url)
-    img, image_format = await gay(byt)
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/gay/", responses=normal_response)
+async def gay_image(byt: bytes = Depends(image_source)):
+    img, image_format = await cached(gay, byt)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/burn/", responses=normal_response)
-async def burn(url: str):
-    byt = await Client.image_bytes(url)
-    img, image_format = await molten(byt)
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/burn/", responses=normal_response)
+async def burn(byt: bytes = Depends(image_source)):
+    img, image_format = await cached(molten, byt)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/earth/", responses=normal_response)
-async def earth_image(url: str):
-    byt = await Client.image_bytes(url)
-    img, image_format = await earth(byt)
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/earth/", responses=normal_response)
+async def earth_image(byt: bytes = Depends(image_source)):
+    img, image_format = await cached(earth, byt)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/freeze/", responses=normal_response)
-async def freeze(url: str):
-    byt = await Client.image_bytes(url)
-    img, image_format = await ice(byt)
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/freeze/", responses=normal_response)
+async def freeze(byt: bytes = Depends(image_source)):
+    img, image_format = await cached(ice, byt)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/ground/", responses=normal_response)
-async def ground(url: str):
-    byt = await Client.image_bytes(url)
-    img, image_format = await earth(byt)
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/ground/", responses=normal_response)
+async def ground(byt: bytes = Depends(image_source)):
+    img, image_format = await cached(earth, byt)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/comic/", responses=normal_response)
-async def comic(url: str):
-    byt = await Client.image_bytes(url)
-    img, image_format = await comic_manip(byt)
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/comic/", responses=normal_response)
+async def comic(byt: bytes = Depends(image_source)):
+    img, image_format = await cached(comic_manip, byt)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/glitch/", responses=static_response_only)
-async def glitch_image(url: str):
-    byt = await Client.image_bytes(url)
-    img = await glitch(byt)
-    return Response(img.read(), media_type="image/png")
+@image_route("/glitch/", responses=static_response_only)
+async def glitch_image(byt: bytes = Depends(image_source)):
+    img = await cached(glitch, byt)
+    return ImageResponse(img, media_type="image/png")
 
 
-@router.get("/pride/", responses=normal_response)
-async def pride_image(url: str, flag: str):
-    byt = await Client.image_bytes(url)
-    img, image_format = await pride(byt, flag)
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/pride/", responses=normal_response)
+async def pride_image(flag: str, byt: bytes = Depends(image_source)):
+    img, image_format = await cached(pride, byt, flag)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/trash/", responses=normal_response)
-async def trash_image(url: str):
-    byt = await Client.image_bytes(url)
-    img, image_format = await trash(byt)
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/trash/", responses=normal_response)
+async def trash_image(byt: bytes = Depends(image_source)):
+    img, image_format = await cached(trash, byt)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/fedora/", responses=normal_response)
-async def fedora_image(url: str):
-    byt = await Client.image_bytes(url)
-    img, image_format = await fedora(byt)
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/fedora/", responses=normal_response)
+async def fedora_image(byt: bytes = Depends(image_source)):
+    img, image_format = await cached(fedora, byt)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/delete/", responses=normal_response)
-async def delete_image(url: str):
-    byt = await Client.image_bytes(url)
-    img, image_format = await delete(byt)
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/delete/", responses=normal_response)
+async def delete_image(byt: bytes = Depends(image_source)):
+    img, image_format = await cached(delete, byt)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/pixel/", responses=normal_response)
-async def pixel_route(url: str):
-    byt = await Client.image_bytes(url)
-    img, image_format = await pixelate(byt)
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/pixel/", responses=normal_response)
+async def pixel_route(byt: bytes = Depends(image_source)):
+    img, image_format = await cached(pixelate, byt)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/deepfry/", responses=normal_response)
-async def test_app(url: str):
-    byt = await Client.image_bytes(url)
-    img, image_format = await deepfry(byt)
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/deepfry/", responses=normal_response)
+async def test_app(byt: bytes = Depends(image_source)):
+    img, image_format = await cached(deepfry, byt)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/mosiac/", responses=normal_response)
-async def mosiac_manip(url: str, pixels: int = 16):
-    byt = await Client.image_bytes(url)
-    img, image_format = await mosiac(byt, pixels)
-    return Response(img.read(), media_type=f"image/{image_format}")
+@image_route("/mosiac/", responses=normal_response)
+async def mosiac_manip(pixels: int = 16, byt: bytes = Depends(image_source)):
+    img, image_format = await cached(mosiac, byt, pixels)
+    return ImageResponse(img, media_type=f"image/{image_format}")
 
 
-@router.get("/ascii/", responses=static_response_only)
-async def asc_image(url: str):
-    byt = await Client.image_bytes(url)
-    img = await ascii_image(byt)
-    return Response(img.read(), media_type="image/png")
+@image_route("/ascii/", responses=static_response_only)
+async def asc_image(byt: bytes = Depends(image_source)):
+    img = await cached(ascii_image, byt)
+    return ImageResponse(img, media_type="image/png")
 
 
-@router.get("/stringify/", responses=static_response_only)
-async def stri_image(url: str):
-    byt = await Client.image_bytes(url)
-    img = await stringify(byt)
-    return Response(img.read(), media_type="image/png")
+@image_route("/stringify/", responses=static_response_only)
+async def stri_image(byt: bytes = Depends(image_source)):
+    img = await cached(stringify, byt)
+    return ImageResponse(img, media_type="image/png")
 
 
-@router.get("/floor/", responses=normal_response)
-async def floor_image(url: str):
-    byt = await Client.image_bytes(url)
-    img, img_format = await floor(byt)
-    return Response(img.read(), media_type=f"image/{img_format}")
+@image_route("/floor/", responses=normal_response)
+async def floor_image(byt: bytes = Depends(image_source)):
+    img, img_format = await cached(floor, byt)
+    return ImageResponse(img, media_type=f"image/{img_format}")
 
 
-@router.get("/charcoal/", responses=normal_response)
-async def charcoal_image(url: str):
-    byt = await Client.image_bytes(url)
-    img, img_format = await charcoal(byt)
-    return Response(img.read(), media_type=f"image/{img_format}")
+@image_route("/charcoal/", responses=normal_response)
+async def charcoal_image(byt: bytes = Depends(image_source)):
+    img, img_format = await cached(charcoal, byt)
+    return ImageResponse(img, media_type=f"image/{img_format}")
 
 
-@router.get("/poster/", responses=normal_response)
-async def poster_image(url: str):
-    byt = await Client.image_bytes(url)
-    img, img_format = await poster(byt)
-    return Response(img.read(), media_type=f"image/{img_format}")
+@image_route("/poster/", responses=normal_response)
+async def poster_image(byt: bytes = Depends(image_source)):
+    img, img_format = await cached(poster, byt)
+    return ImageResponse(img, media_type=f"image/{img_format}")
 
 
-@router.get("/sepia/", responses=normal_response)
-async def sepia_image(url: str):
-    byt = await Client.image_bytes(url)
-    img, img_format = await sepia(byt)
-    return Response(img.read(), media_type=f"image/{img_format}")
+@image_route("/sepia/", responses=normal_response)
+async def sepia_image(byt: bytes = Depends(image_source)):
+    img, img_format = await cached(sepia, byt)
+    return ImageResponse(img, media_type=f"image/{img_format}")
 
 
-@router.get("/polaroid/", responses=normal_response)
-async def polar_image(url: str):
-    byt = await Client.image_bytes(url)
-    img, img_format = await polaroid(byt)
-    return Response(img.read(), media_type=f"image/{img_format}")
+@image_route("/polaroid/", responses=normal_response)
+async def polar_image(byt: bytes = Depends(image_source)):
+    img, img_format = await cached(polaroid, byt)
+    return ImageResponse(img, media_type=f"image/{img_format}")
 
 
-@router.get("/swirl/", responses=normal_response)
-async def swirl_image(url: str):
-    byt = await Client.image_bytes(url)
-    img, img_format = await swirl(byt)
-    return Response(img.read(), media_type=f"image/{img_format}")
+@image_route("/swirl/", responses=normal_response)
+async def swirl_image(byt: bytes = Depends(image_source)):
+    img, img_format = await cached(swirl, byt)
+    return ImageResponse(img, media_type=f"image/{img_format}")
 
 
-@router.get("/paint/", responses=normal_response)
-async def paint_image(url: str):
-    byt = await Client.image_bytes(url)
-    img, img_format = await paint(byt)
-    return Response(img.read(), media_type=f"image/{img_format}")
+@image_route("/paint/", responses=normal_response)
+async def paint_image(byt: bytes = Depends(image_source)):
+    img, img_format = await cached(paint, byt)
+    return ImageResponse(img, media_type=f"image/{img_format}")
 
 
-@router.get("/night/", responses=normal_response)
-async def night_image(url: str):
-    byt = await Client.image_bytes(url)
-    img, img_format = await night(byt)
-    return Response(img.read(), media_type=f"image/{img_format}")
+@image_route("/night/", responses=normal_response)
+async def night_image(byt: bytes = Depends(image_source)):
+    img, img_format = await cached(night, byt)
+    return ImageResponse(img, media_type=f"image/{img_format}")
 
 
 # @router.get("/solar/", responses=normal_response)
 # async def solar_image(url: str):
 #     byt = await Client.image_bytes(url)
-#     img, img_format = await solar(byt)
-#     return Response(img.read(), media_type=f"image/{img_format}")
+#     img, img_format = await cached(solar, byt)
+#     return ImageResponse(img, media_type=f"image/{img_format}")
 
 
-@router.get("/america/", responses=gif_response_only)
-async def america_image(url: str):
-    byt = await Client.image_bytes(url)
-    img = await america(byt)
-    return Response(img.read(), media_type="image/gif")
+@image_route("/america/", responses=gif_response_only)
+async def america_image(byt: bytes = Depends(image_source)):
+    img = await cached(america, byt)
+    return ImageResponse(img, media_type="image/gif")
 
 
-@router.get("/sketch/", responses=gif_response_only)
-async def sketch_image(url: str):
-    byt = await Client.image_bytes(url)
-    img = await quantize(byt)
-    return Response(img.read(), media_type="image/gif")
+@image_route("/sketch/", responses=gif_response_only)
+async def sketch_image(byt: bytes = Depends(image_source)):
+    chunks = await cached(quantize, byt)
+    return StreamingResponse(chunks, media_type="image/gif")
 
 
-@router.get("/spin/", responses=gif_response_only)
-async def spin_image(url: str):
-    byt = await Client.image_bytes(url)
-    img = await spin_manip(byt)
-    return Response(img.read(), media_type="image/gif")
+@image_route("/spin/", responses=gif_response_only)
+async def spin_image(byt: bytes = Depends(image_source)):
+    img = await cached(spin_manip, byt)
+    return ImageResponse(img, media_type="image/gif")
 
 
-@router.get("/petpet/", responses=gif_response_only)
-async def pet_pet_image(url: str):
-    byt = await Client.image_bytes(url)
-    img = await petpetgen(byt)
-    return Response(img.read(), media_type="image/gif")
+@image_route("/petpet/", responses=gif_response_only)
+async def pet_pet_image(byt: bytes = Depends(image_source)):
+    img = await cached(petpetgen, byt)
+    return ImageResponse(img, media_type="image/gif")
 
 
-@router.get("/dissolve/", responses=gif_response_only)
-async def dissolve(url: str, transparent: bool = False):
-    byt = await Client.image_bytes(url)
-    img = await gen_dissolve(byt, transparent)
-    return Response(img.read(), media_type="image/gif")
+@image_route("/dissolve/", responses=gif_response_only)
+async def dissolve(transparent: bool = False,
+                   byt: bytes = Depends(image_source)):
+    chunks = await gen_dissolve(byt, transparent)
+    return StreamingResponse(chunks, media_type="image/gif")
 
 
-@router.get("/communism/", responses=gif_response_only)
-async def commie_image(url: str):
-    byt = await Client.image_bytes(url)
-    img = await communism(byt)
-    return Response(img.read(), media_type="image/gif")
+@image_route("/communism/", responses=gif_response_only)
+async def commie_image(byt: bytes = Depends(image_source)):
+    img = await cached(communism, byt)
+    return ImageResponse(img, media_type="image/gif")
 
 
-@router.get("/thoughtimage/", responses=normal_response)
-async def get_thought_image(url: str, text: str):
-    byt = await Client.image_bytes(url)
-    img, img_format = await thought_image(byt, text)
-    return Response(img.read(), media_type=f"image/{img_format}")
+@image_route("/thoughtimage/", responses=normal_response)
+async def get_thought_image(text: str, byt: bytes = Depends(image_source)):
+    img, img_format = await cached(thought_image, byt, text)
+    return ImageResponse(img, media_type=f"image/{img_format}")
 
 
-@router.get("/captcha/", responses=normal_response)
-async def get_captcha_image(url: str, text: str):
-    byt = await Client.image_bytes(url)
-    img = await captcha(byt, text)
-    return Response(img.read(), media_type="image/png")
+@image_route("/captcha/", responses=normal_response)
+async def get_captcha_image(text: str, byt: bytes = Depends(image_source)):
+    img = await cached(captcha, byt, text)
+    return ImageResponse(img, media_type="image/png")
 
 
-@router.get("/tweet/", responses=static_response_only)
-async def tweet(url: str, username: str, text: str):
-    byt = await Client.image_bytes(url)
+@image_route("/tweet/", responses=static_response_only)
+async def tweet(username: str, text: str, byt: bytes = Depends(image_source)):
     img = await tweet_gen(byt, username, text)
-    return Response(img.read(), media_type="image/png")
+    return ImageResponse(img, media_type="image/png")
 
 
-@router.get("/rainbow/", responses=normal_response)
-async def rainbow_manip(url: str):
-    byt = await Client.image_bytes(url)
-    img, img_format = await rainbow(byt)
-    return Response(img.read(), media_type=f"image/{img_format}")
+@image_route("/rainbow/", responses=normal_response)
+async def rainbow_manip(byt: bytes = Depends(image_source)):
+    img, img_format = await cached(rainbow, byt)
+    return ImageResponse(img, media_type=f"image/{img_format}")
 
 
-@router.get("/magik/", responses=normal_response)
-async def magic(url: str, scale: int = None):
-    byt = await Client.image_bytes(url)
-    img, img_format = await magik(byt, scale)
-    return Response(img.read(), media_type=f"image/{img_format}")
+@image_route("/magik/", responses=normal_response)
+async def magic(scale: int = None, byt: bytes = Depends(image_source)):
+    img, img_format = await cached(magik, byt, scale)
+    return ImageResponse(img, media_type=f"image/{img_format}")
 
 
-@router.get("/discord/", responses=static_response_only)
-async def discord_quote(url: str, username: str, text: str, dark: bool = True):
-    byt = await Client.image_bytes(url)
+@image_route("/discord/", responses=static_response_only)
+async def discord_quote(username: str, text: str, dark: bool = True,
+                        byt: bytes = Depends(image_source)):
     img = await quote(byt, username, text, dark)
-    return Response(img.read(), media_type="image/png")
+    return ImageResponse(img, media_type="image/png")
 
 
-@router.get("/yt/", responses=static_response_only)
-async def youtube_comment(url: str, username: str, text: str, dark: bool = True):
-    byt = await Client.image_bytes(url)
+@image_route("/yt/", responses=static_response_only)
+async def youtube_comment(username: str, text: str, dark: bool = True,
+                          byt: bytes = Depends(image_source)):
     img = await yt_comment(byt, username, text, dark)
-    return Response(img.read(), media_type="image/png")
+    return ImageResponse(img, media_type="image/png")
 
 
-@router.get("/neon/", responses=normal_response)
-async def neon_image(url: str, sharp: bool = True, soft: bool = True,
+@image_route("/neon/", responses=normal_response)
+async def neon_image(sharp: bool = True, soft: bool = True,
                      overlay: bool = False, multi: bool = False,
                      gradient: int = 0, per_color: int = None,
                      colors_per_frame: int = None, direction: str = 'left',
-                     colors=None):
+                     colors=None, byt: bytes = Depends(image_source)):
     if colors is None:
         colors = [(244, 40, 43),
                   (241, 196, 15),
@@ -465,32 +437,29 @@ async def neon_image(url: str, sharp: bool = True, soft: bool = True,
                   (52, 152, 249),
                   (180, 49, 182)]
     animated = multi or len(colors) > 1
-    byt = await Client.image_bytes(url)
-    img = await neon(byt, colors, multi=multi, sharp=sharp, soft=soft,
-                     overlay=overlay, direction=direction, gradient=gradient,
-                     per_color=per_color, colors_per_frame=colors_per_frame)
-    return Response(img.read(), media_type=f"image/{'gif' if animated else 'png'}")
+    img = await cached(neon, byt, colors, multi=multi, sharp=sharp,
+                       soft=soft, overlay=overlay, direction=direction,
+                       gradient=gradient, per_color=per_color,
+                       colors_per_frame=colors_per_frame)
+    return ImageResponse(img, media_type=f"image/{'gif' if animated else 'png'}")
                     
-@router.get("/bomb/", responses=gif_response_only)
-async def bomb_gif(url: str):
-    byt = await Client.image_bytes(url)
-    img = await bomb(byt)
-    return Response(img.read(), media_type="image/gif")
+@image_route("/bomb/", responses=gif_response_only)
+async def bomb_gif(byt: bytes = Depends(image_source)):
+    chunks = await bomb(byt)
+    return StreamingResponse(chunks, media_type="image/gif")
                     
 # @router.get("/flash/", responses=gif_response_only)
 # async def flash_gif(url: str):
 #     byt = await Client.image_bytes(url)
-#     img = await flash(byt)
-#     return Response(img.read(), media_type="image/gif")
+#     img = await cached(flash, byt)
+#     return ImageResponse(img, media_type="image/gif")
                     
-@router.get("/shake/", responses=gif_response_only)
-async def shake_gif(url: str):
-    byt = await Client.image_bytes(url)
+@image_route("/shake/", responses=gif_response_only)
+async def shake_gif(byt: bytes = Depends(image_source)):
     img = await shake(byt)
-    return Response(img.read(), media_type="image/gif")
+    return ImageResponse(img, media_type="image/gif")
                     
-@router.get("/bonk/", responses=gif_response_only)
-async def bonk_gif(url: str):
-    byt = await Client.image_bytes(url)
-    img = await bonk(byt)
-    return Response(img.read(), media_type="image/gif")
+@image_route("/bonk/", responses=gif_response_only)
+async def bonk_gif(byt: bytes = Depends(image_source)):
+    img = await cached(bonk, byt)
+    return ImageResponse(img, media_type="image/gif")
@@ -1,6 +1,30 @@
+from io import BytesIO
+
+from fastapi import Response
 from pydantic import BaseModel
 
 
+class ImageResponse(Response):
+    """Sends a manipulation's ``BytesIO`` without copying it.
+
+    The body is a view of the buffer, so its length is known up front for
+    ``Content-Length`` and the server writes the image straight from it.
+    The size a manipulation actually worked at, when it records one, is
+    sent as ``X-Processing-Size``.
+    """
+
+    def __init__(self, content, *args, **kwargs):
+        super().__init__(content, *args, **kwargs)
+        size = getattr(content, "processing_size", None)
+        if size is not None:
+            self.headers["X-Processing-Size"] = size
+
+    def render(self, content) -> bytes:
+        if isinstance(content, BytesIO):
+            return content.getbuffer()
+        return super().render(content)
+
+
 class Message(BaseModel):
     message: str
 
@@ -60,6 +84,23 @@ responses = {
             }
         }
     },
+    "503": {
+        "message": Message,
+        "content": {
+            "application/json": {
+                "example": {"message": "Server is busy, try again later"}
+            }
+        }
+    },
+    "504": {
+        "message": Message,
+        "content": {
+            "application/json": {
+                "example": {
+                    "message": "Image took too long to be processed"}
+            }
+        }
+    },
     "400": {
         "message": Message,
         "content": {
@@ -0,0 +1,39 @@
+from typing import List, Optional
+
+from fastapi import Request
+
+from app.exceptions.errors import ParameterError
+from app.utils.client import Client
+from app.utils.uploads import read_uploads, upload_field
+
+
+async def _resolve(request: Request, urls: List[Optional[str]]) -> List[bytes]:
+    uploads = [None] * len(urls)
+    if request.method == "POST":
+        uploads = await read_uploads(request, len(urls))
+    missing = [index for index, upload in enumerate(uploads)
+               if upload is None]
+    for index in missing:
+        if urls[index] is None:
+            field = upload_field(index)
+            raise ParameterError(f"Upload {field} or pass "
+                                 f"{field.replace('image', 'url')}")
+    if missing:
+        fetched = await Client.image_bytes_many(
+            *(urls[index] for index in missing))
+        for index, byt in zip(missing, fetched):
+            uploads[index] = byt
+    return uploads
+
+
+async def image_source(request: Request, url: Optional[str] = None) -> bytes:
+    """The route's image, uploaded in a POST body or downloaded from
+    ``url``."""
+    byt, = await _resolve(request, [url])
+    return byt
+
+
+async def image_pair(request: Request, url: Optional[str] = None,
+                     url2: Optional[str] = None) -> List[bytes]:
+    """Both images of a two image route, each uploaded or downloaded."""
+    return await _resolve(request, [url, url2])
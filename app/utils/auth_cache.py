@@ -0,0 +1,71 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+from prometheus_client import Counter
+
+from .client import AuthModel, Client
+
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", 10))
+AUTH_CACHE_ENTRIES = int(os.getenv("AUTH_CACHE_ENTRIES", 10000))
+
+AUTH_CACHE_REQUESTS = Counter("dagpi_auth_cache_requests_total",
+                              "Token lookups by cache outcome", ["result"])
+
+
+class AuthCache:
+    """Short lived cache of token lookups.
+
+    The backend counts the request that triggers a lookup against the
+    token, so only requests served from a cached entry decrement its
+    remaining ratelimit locally. Entries are refetched from the backend
+    after ``ttl`` seconds, which reconciles the local count with it.
+
+    Each worker process keeps its own cache and counts, so between
+    reconciliations a token can spend its remaining limit once in every
+    worker, up to the number of workers times its limit in total.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._inflight = {}
+
+    async def _lookup(self, token: str) -> AuthModel:
+        tok = await Client.auth(token)
+        # the request this lookup is for was counted by the backend
+        tok.counted = True
+        self._entries[token] = (tok, time.monotonic() + self.ttl)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return tok
+
+    async def get(self, token: str) -> AuthModel:
+        entry = self._entries.get(token)
+        if entry is not None and time.monotonic() < entry[1]:
+            AUTH_CACHE_REQUESTS.labels("hit").inc()
+            return entry[0]
+        AUTH_CACHE_REQUESTS.labels("miss").inc()
+        task = self._inflight.get(token)
+        if task is None:
+            task = asyncio.ensure_future(self._lookup(token))
+            self._inflight[token] = task
+            task.add_done_callback(
+                lambda _task: self._inflight.pop(token, None))
+        return await asyncio.shield(task)
+
+    @staticmethod
+    def consume(tok: AuthModel):
+        if tok.counted:
+            # the first request after a lookup, already in ``left``
+            tok.counted = False
+            return
+        tok.left = max(0, tok.left - 1)
+        if tok.left == 0:
+            tok.ratelimited = True
+
+
+auth_cache = AuthCache(AUTH_CACHE_TTL, AUTH_CACHE_ENTRIES)
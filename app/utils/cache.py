@@ -0,0 +1,244 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import AsyncIterator, Optional
+
+from prometheus_client import Counter, Gauge
+from starlette.concurrency import run_in_threadpool
+
+CACHE_BACKEND = os.getenv("RESULT_CACHE", "memory")
+# held by every worker with the memory backend
+CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 32 * (2 ** 20)))
+CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "/dev/shm/dagpi-cache")
+
+CACHE_HITS = Counter("dagpi_result_cache_hits_total",
+                     "Manipulation results served from the cache",
+                     ["backend"])
+CACHE_MISSES = Counter("dagpi_result_cache_misses_total",
+                       "Manipulation results that had to be rendered",
+                       ["backend"])
+CACHE_EVICTIONS = Counter("dagpi_result_cache_evictions_total",
+                          "Results evicted to stay under the size limit",
+                          ["backend"])
+CACHE_BYTES = Gauge("dagpi_result_cache_bytes",
+                    "Bytes currently held by the result cache", ["backend"])
+
+
+class MemoryCache:
+    """An in process LRU bounded by the total size of the stored values."""
+
+    name = "memory"
+    blocking = False
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _key, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                CACHE_EVICTIONS.labels(self.name).inc()
+            CACHE_BYTES.labels(self.name).set(self.size)
+
+
+class DiskCache:
+    """A file per entry store that every gunicorn worker can share.
+
+    Pointing the directory at ``/dev/shm`` keeps it in memory. Reads bump
+    the file modification time, and the directory is swept oldest first
+    whenever enough new data has been written to possibly exceed the
+    size limit. Its methods block on file IO, so :func:`cached` calls
+    them in the thread pool.
+    """
+
+    name = "disk"
+    blocking = True
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._written = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return value
+
+    def set(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(value)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            return
+        with self._lock:
+            self._written += len(value)
+            sweep = self._written > self.max_bytes // 8
+            if sweep:
+                self._written = 0
+        if sweep:
+            self.sweep()
+
+    def sweep(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        size = sum(e[1] for e in entries)
+        for _mtime, length, path in sorted(entries):
+            if size <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            size -= length
+            CACHE_EVICTIONS.labels(self.name).inc()
+        CACHE_BYTES.labels(self.name).set(size)
+
+
+def get_cache():
+    if CACHE_BACKEND == "memory":
+        return MemoryCache(CACHE_SIZE)
+    if CACHE_BACKEND == "disk":
+        return DiskCache(CACHE_DIR, CACHE_SIZE)
+    return None
+
+
+result_cache = get_cache()
+
+
+def cache_key(name: str, image: bytes, args, kwargs) -> str:
+    digest = hashlib.blake2b(image, digest_size=20)
+    params = []
+    for arg in args:
+        # further images, as passed to the two image manipulations
+        if isinstance(arg, bytes):
+            digest.update(arg)
+            arg = len(arg)
+        params.append(arg)
+    params = repr((params, sorted(kwargs.items())))
+    digest.update(f"\0{name}\0{params}".encode())
+    return digest.hexdigest()
+
+
+def _pack(result) -> bytes:
+    if isinstance(result, tuple):
+        img, image_format = result
+        header = image_format
+        size = getattr(img, "processing_size", None)
+        if size is not None:
+            header += f" {size}"
+        return b"".join((f"{header}\n".encode(), img.getbuffer()))
+    return b"".join((b"\n", result.getbuffer()))
+
+
+def _unpack(value: bytes):
+    split = value.index(b"\n")
+    # built from a view so the body is copied once, into a buffer the
+    # response can then send without copying again
+    img = BytesIO(memoryview(value)[split + 1:])
+    if split:
+        image_format, _, size = value[:split].decode().partition(" ")
+        if size:
+            img.processing_size = size
+        return img, image_format
+    return img
+
+
+async def _get(key: str) -> Optional[bytes]:
+    if result_cache.blocking:
+        return await run_in_threadpool(result_cache.get, key)
+    return result_cache.get(key)
+
+
+async def _set(key: str, value: bytes):
+    if result_cache.blocking:
+        await run_in_threadpool(result_cache.set, key, value)
+    else:
+        result_cache.set(key, value)
+
+
+async def _replay(value: bytes) -> AsyncIterator[bytes]:
+    yield value
+
+
+async def _tee(chunks: AsyncIterator[bytes], key: str):
+    # stored once the stream has been read to the end
+    body = [b"\n"]
+    size = 0
+    async for chunk in chunks:
+        if body is not None:
+            body.append(chunk)
+            size += len(chunk)
+            if size > result_cache.max_bytes:
+                body = None
+        yield chunk
+    if body is not None:
+        await _set(key, b"".join(body))
+
+
+async def cached(function, image: bytes, *args, **kwargs):
+    """Await ``function(image, *args, **kwargs)`` through the result cache.
+
+    Results are keyed on a hash of the source bytes, the manipulation
+    name and its parameters, and are returned in the same shape the
+    manipulation returns them. Streamed results are copied into the
+    cache as they are read. Manipulations with random output are not
+    passed through here, or their first result would be served forever.
+    """
+    if result_cache is None:
+        return await function(image, *args, **kwargs)
+    key = cache_key(function.__name__, image, args, kwargs)
+    value = await _get(key)
+    if value is not None:
+        CACHE_HITS.labels(result_cache.name).inc()
+        if getattr(function, "streams", False):
+            return _replay(value[1:])
+        return _unpack(value)
+    CACHE_MISSES.labels(result_cache.name).inc()
+    result = await function(image, *args, **kwargs)
+    if getattr(function, "streams", False):
+        return _tee(result, key)
+    await _set(key, _pack(result))
+    return result
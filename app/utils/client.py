@@ -1,25 +1,83 @@
 import asyncio
+import functools
 import os
 import re
+import time
 import urllib.parse
-from typing import Dict
+from typing import AsyncIterator, Dict, List, Optional
 
 import httpx
 from async_timeout import timeout
 
-from ..exceptions.errors import BadUrl, NoImageFound, ServerTimeout
+from ..exceptions.errors import (BadImage, BadUrl, FileLarge, NoImageFound,
+                                 ServerTimeout)
+from .fetch_cache import FETCH_CACHE_REQUESTS, fetch_cache
+from .host_guard import host_guards, host_key
+from .http import (BACKEND_MAX_CONNECTIONS, BACKEND_MAX_KEEPALIVE,
+                   HTTP_CONNECT_TIMEOUT, HTTP_POOL_TIMEOUT,
+                   ORIGIN_MAX_CONNECTIONS, ORIGIN_MAX_KEEPALIVE, HTTPClient)
 
 headers = {'Authorization': os.getenv("TOKEN", "What")}
 base_url = os.getenv("BASE_URL", "https://dagbot.daggy.tech")
 print(headers, base_url)
-_session = None
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", 15 * (2 ** 20)))
+FETCH_TIMEOUT = 10
+IMAGE_SIGNATURES = (b"\x89PNG\r\n\x1a\n", b"\xff\xd8\xff", b"GIF87a", b"GIF89a")
+_inflight: Dict[str, asyncio.Future] = {}
+_waiters: Dict[str, int] = {}
 
+# image downloads from arbitrary origins, which must not see the token
+origin_client = HTTPClient("origin", ORIGIN_MAX_CONNECTIONS,
+                           ORIGIN_MAX_KEEPALIVE)
+# auth and stat calls to the dagpi backend
+backend_client = HTTPClient("backend", BACKEND_MAX_CONNECTIONS,
+                            BACKEND_MAX_KEEPALIVE, base_url=base_url,
+                            headers=headers)
 
-async def get_session():
-    global _session
-    if _session is None:
-        _session = httpx.AsyncClient(headers=headers)
-    return _session
+
+def open_clients():
+    origin_client.open()
+    backend_client.open()
+
+
+async def close_clients():
+    await origin_client.close()
+    await backend_client.close()
+
+
+def is_image(head: bytes) -> bool:
+    if head.startswith(IMAGE_SIGNATURES):
+        return True
+    return head[:4] == b"RIFF" and head[8:12] == b"WEBP"
+
+
+async def read_image_stream(chunks: AsyncIterator[bytes],
+                            content_length: Optional[str] = None) -> bytes:
+    """Read an image body, giving up as early as possible.
+
+    The declared length is checked before anything is read, the stream is
+    abandoned once it passes ``MAX_IMAGE_BYTES`` and the first bytes must
+    carry a PNG, JPEG, GIF or WebP signature.
+    """
+    try:
+        if content_length is not None and \
+                int(content_length) > MAX_IMAGE_BYTES:
+            raise FileLarge("Image exceeds maximum size")
+    except ValueError:
+        pass
+    body = bytearray()
+    sniffed = False
+    async for chunk in chunks:
+        body += chunk
+        if len(body) > MAX_IMAGE_BYTES:
+            raise FileLarge("Image exceeds maximum size")
+        if not sniffed and len(body) >= 12:
+            if not is_image(body):
+                raise BadImage("Not an image")
+            sniffed = True
+    if not sniffed and not is_image(body):
+        raise BadImage("Not an image")
+    return bytes(body)
 
 
 class AuthModel:
@@ -30,20 +88,22 @@ class AuthModel:
         self.premium = obj.get("premium")
         self.ratelimit = int(obj.get("ratelimit"))
         self.left = int(obj.get("left"))
+        # whether the backend already counted a request not yet served
+        self.counted = False
 
 
 class Client:
+    # cleared once the backend turns out not to have /statpost/bulk
+    bulk_stats = True
 
     @staticmethod
     async def auth(token: str):
-        session = await get_session()
         print(f"{base_url}/auth/{token}")
-        r = await session.get(f"{base_url}/auth/{token}")
+        r = await backend_client.request("GET", f"/auth/{token}")
         return AuthModel(r.json())
 
     @staticmethod
     async def post_stat(route: str, token: str, ua: str):
-        session = await get_session()
         js = {
             "api": "image",
             "route": route,
@@ -51,8 +111,29 @@ class Client:
             "user_agent": ua
 
         }
-        r = await session.post(f"{base_url}/statpost", json=js)
-        print(r.status_code)
+        r = await backend_client.request("POST", "/statpost", json=js)
+        r.raise_for_status()
+
+    @staticmethod
+    async def post_stats(stats: List[Dict]) -> List[Dict]:
+        """Post buffered stats, returning the ones the backend did not take.
+
+        A backend without the bulk endpoint is sent every stat on its own
+        through ``/statpost`` from then on.
+        """
+        if Client.bulk_stats:
+            r = await backend_client.request("POST", "/statpost/bulk",
+                                             json={"stats": stats})
+            if r.status_code not in (404, 405):
+                r.raise_for_status()
+                return []
+            Client.bulk_stats = False
+        posted = await asyncio.gather(
+            *(Client.post_stat(stat["route"], stat["token"],
+                               stat["user_agent"]) for stat in stats),
+            return_exceptions=True)
+        return [stat for stat, result in zip(stats, posted)
+                if isinstance(result, Exception)]
 
     @staticmethod
     async def image_bytes(url: str):
@@ -68,17 +149,112 @@ class Client:
         r = (re.match(regex, url) is not None)
         if not r:
             raise BadUrl('Your url is malformed')
-        session = await get_session()
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme.lower() not in ("http", "https"):
+            raise BadUrl('Only http and https urls are supported')
         try:
-            async with timeout(10):
+            parts.port
+        except ValueError:
+            raise BadUrl('Your url is malformed')
+        entry = fetch_cache.get(url)
+        if entry is not None and entry.fresh:
+            FETCH_CACHE_REQUESTS.labels("hit").inc()
+            return entry.body
+        # concurrent requests for the same url share a single download,
+        # which is cancelled once nobody is waiting for it
+        task = _inflight.get(url)
+        if task is None:
+            task = asyncio.ensure_future(Client._fetch(url))
+            _inflight[url] = task
+            task.add_done_callback(functools.partial(_fetch_done, url))
+        else:
+            FETCH_CACHE_REQUESTS.labels("shared").inc()
+        _waiters[url] = _waiters.get(url, 0) + 1
+        try:
+            async with timeout(FETCH_TIMEOUT):
+                return await asyncio.shield(task)
+        except asyncio.TimeoutError:
+            raise ServerTimeout("Server Timed Out")
+        finally:
+            _waiters[url] -= 1
+            if not _waiters[url]:
+                del _waiters[url]
+                # dropped now, not when the task finishes, so a request
+                # arriving in between starts a download of its own
+                # rather than joining a cancelled one
+                if _inflight.get(url) is task:
+                    del _inflight[url]
+                task.cancel()
+
+    @staticmethod
+    async def image_bytes_many(*urls: str) -> List[bytes]:
+        """Download several images at once, in the order given.
+
+        Repeated urls are downloaded once and every download shares one
+        deadline. The first failure cancels the others and is raised.
+        """
+        fetches = {url: asyncio.ensure_future(Client.image_bytes(url))
+                   for url in dict.fromkeys(urls)}
+        try:
+            async with timeout(FETCH_TIMEOUT):
+                await asyncio.gather(*fetches.values())
+        except asyncio.TimeoutError:
+            raise ServerTimeout("Server Timed Out")
+        finally:
+            for fetch in fetches.values():
+                fetch.cancel()
+        return [fetches[url].result() for url in urls]
+
+    @staticmethod
+    async def _fetch(url: str) -> bytes:
+        entry = fetch_cache.get(url)
+        guard = host_guards.get(host_key(url))
+        # reads may stall for a few times the host's usual latency
+        read_timeout = httpx.Timeout(guard.read_timeout,
+                                     connect=HTTP_CONNECT_TIMEOUT,
+                                     pool=HTTP_POOL_TIMEOUT)
+        try:
+            async with timeout(FETCH_TIMEOUT), guard.slot():
+                started = time.perf_counter()
                 try:
-                    r = await session.get(url)
-                    if r.status_code == 200:
-                        byt: bytes = r.read()
+                    async with origin_client.stream(
+                            "GET", url, timeout=read_timeout,
+                            headers=entry.validators if entry else None) as r:
+                        if r.status_code >= 500:
+                            guard.failed()
+                        else:
+                            guard.succeeded(time.perf_counter() - started)
+                        if r.status_code == 304 and entry is not None:
+                            FETCH_CACHE_REQUESTS.labels("revalidated").inc()
+                            entry.refresh(r.headers)
+                            return entry.body
+                        if r.status_code != 200:
+                            fetch_cache.discard(url)
+                            raise NoImageFound("Non 200 Status Code")
+                        FETCH_CACHE_REQUESTS.labels("miss").inc()
+                        byt = await read_image_stream(
+                            r.aiter_bytes(), r.headers.get("content-length"))
+                        fetch_cache.store(url, byt, r.headers)
                         return byt
-                    else:
-                        raise NoImageFound("Non 200 Status Code")
+                except httpx.PoolTimeout:
+                    # waiting on our own connection pool, not on the host
+                    raise ServerTimeout("Server Timed Out")
+                except (httpx.TimeoutException, httpx.ConnectError) as e:
+                    # the host did not answer, anything else is down to
+                    # the url or the response and says nothing about it
+                    guard.failed()
+                    if isinstance(e, httpx.TimeoutException):
+                        raise ServerTimeout("Server Timed Out")
+                    raise NoImageFound("Requesting Error")
                 except httpx.RequestError:
                     raise NoImageFound("Requesting Error")
         except asyncio.TimeoutError:
             raise ServerTimeout("Server Timed Out")
+
+
+def _fetch_done(url: str, task: asyncio.Future):
+    if _inflight.get(url) is task:
+        del _inflight[url]
+    if not task.cancelled():
+        # retrieved here so abandoned downloads do not log a warning
+        task.exception()
@@ -0,0 +1,131 @@
+import os
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+from prometheus_client import Counter, Gauge
+
+FETCH_CACHE_SIZE = int(os.getenv("FETCH_CACHE_SIZE", 64 * (2 ** 20)))
+# upper bound on heuristic freshness for responses without explicit expiry
+HEURISTIC_MAX_AGE = 24 * 60 * 60
+
+FETCH_CACHE_REQUESTS = Counter("dagpi_fetch_cache_requests_total",
+                               "Source image lookups by cache outcome",
+                               ["result"])
+FETCH_CACHE_BYTES = Gauge("dagpi_fetch_cache_bytes",
+                          "Bytes of source images held in the fetch cache")
+
+
+def _http_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _cache_control(headers) -> Dict[str, Optional[str]]:
+    directives = {}
+    for part in headers.get("cache-control", "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"') or None
+    return directives
+
+
+def freshness_lifetime(headers) -> Optional[float]:
+    """Seconds a response may be reused without revalidating.
+
+    Returns ``None`` when the response must not be stored at all.
+    """
+    directives = _cache_control(headers)
+    if "no-store" in directives or "private" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0
+    for name in ("s-maxage", "max-age"):
+        if directives.get(name):
+            try:
+                age = int(headers.get("age", 0))
+                return max(0, int(directives[name]) - age)
+            except ValueError:
+                return 0
+    date = _http_date(headers.get("date")) or time.time()
+    expires = headers.get("expires")
+    if expires is not None:
+        expires = _http_date(expires)
+        return max(0, expires - date) if expires else 0
+    last_modified = _http_date(headers.get("last-modified"))
+    if last_modified:
+        return min(HEURISTIC_MAX_AGE, max(0, (date - last_modified) / 10))
+    return 0
+
+
+class CachedResponse:
+
+    def __init__(self, body: bytes, headers):
+        self.body = body
+        self.etag = headers.get("etag")
+        self.last_modified = headers.get("last-modified")
+        self.expires = 0
+        self.refresh(headers)
+
+    def refresh(self, headers):
+        self.etag = headers.get("etag", self.etag)
+        self.last_modified = headers.get("last-modified", self.last_modified)
+        lifetime = freshness_lifetime(headers)
+        self.expires = time.monotonic() + (lifetime or 0)
+
+    @property
+    def fresh(self) -> bool:
+        return time.monotonic() < self.expires
+
+    @property
+    def validators(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class FetchCache:
+    """An LRU of fetched source images bounded by total body size."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(url)
+        if entry is not None:
+            self._entries.move_to_end(url)
+        return entry
+
+    def store(self, url: str, body: bytes, headers):
+        self.discard(url)
+        lifetime = freshness_lifetime(headers)
+        if lifetime is None or len(body) > self.max_bytes:
+            return
+        entry = CachedResponse(body, headers)
+        if not entry.fresh and not entry.validators:
+            return
+        self._entries[url] = entry
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _url, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted.body)
+        FETCH_CACHE_BYTES.set(self.size)
+
+    def discard(self, url: str):
+        entry = self._entries.pop(url, None)
+        if entry is not None:
+            self.size -= len(entry.body)
+            FETCH_CACHE_BYTES.set(self.size)
+
+
+fetch_cache = FetchCache(FETCH_CACHE_SIZE)
@@ -0,0 +1,157 @@
+import asyncio
+import contextlib
+import os
+import time
+from collections import OrderedDict, deque
+from urllib.parse import urlsplit
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from ..exceptions.errors import SourceUnavailable
+from .http import HTTP_READ_TIMEOUT, ORIGIN_MAX_CONNECTIONS
+
+# downloads from one host at a time, further ones wait for a slot. Most
+# sources come from one or two CDNs, so by default a host may use a
+# quarter of the origin connection pool, enough that a busy CDN is not
+# throttled while a stalled one can only tie up that quarter
+HOST_MAX_CONCURRENCY = int(os.getenv("HOST_MAX_CONCURRENCY",
+                                     max(1, ORIGIN_MAX_CONNECTIONS // 4)))
+# the read timeout is this many times a host's recent p95 latency
+HOST_TIMEOUT_FACTOR = float(os.getenv("HOST_TIMEOUT_FACTOR", 3))
+HOST_MIN_TIMEOUT = float(os.getenv("HOST_MIN_TIMEOUT", 2))
+HOST_LATENCY_SAMPLES = int(os.getenv("HOST_LATENCY_SAMPLES", 100))
+HOST_MIN_SAMPLES = int(os.getenv("HOST_MIN_SAMPLES", 20))
+# consecutive failures that open a host's breaker, and for how long
+HOST_FAILURE_THRESHOLD = int(os.getenv("HOST_FAILURE_THRESHOLD", 5))
+HOST_BREAKER_COOLDOWN = float(os.getenv("HOST_BREAKER_COOLDOWN", 30))
+HOST_GUARD_MAX_HOSTS = int(os.getenv("HOST_GUARD_MAX_HOSTS", 256))
+
+CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+HOST_LATENCY = Histogram("dagpi_fetch_host_latency_seconds",
+                         "Time to response headers from each image host",
+                         ["host"])
+HOST_BREAKER_STATE = Gauge("dagpi_fetch_host_breaker_state",
+                           "Breaker state of each image host, 0 closed, "
+                           "1 half open, 2 open", ["host"])
+HOST_REJECTED = Counter("dagpi_fetch_host_rejected_total",
+                        "Downloads refused because the host's breaker was "
+                        "open", ["host"])
+
+
+def host_key(url: str) -> str:
+    """``scheme://host:port`` of a url, what a guard is kept for, so
+    another port or scheme on a host cannot trip that host's breaker."""
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    port = parts.port or {"http": 80, "https": 443}.get(scheme)
+    return f"{scheme}://{parts.hostname}:{port}"
+
+
+class HostGuard:
+    """Limits, times and trips the downloads from one image host.
+
+    At most ``HOST_MAX_CONCURRENCY`` downloads run at once, 25 with the
+    default pool size. After ``HOST_FAILURE_THRESHOLD`` failures in a row
+    the breaker opens and downloads fail straight away for
+    ``HOST_BREAKER_COOLDOWN`` seconds, then a single download is let
+    through to probe the host. Only failures of the host itself count:
+    connect errors, timeouts and 5xx responses.
+    """
+
+    def __init__(self, host: str):
+        self.host = host
+        self.semaphore = asyncio.Semaphore(HOST_MAX_CONCURRENCY)
+        self.latencies = deque(maxlen=HOST_LATENCY_SAMPLES)
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.active = 0
+        self._probing = False
+
+    @property
+    def read_timeout(self) -> float:
+        if len(self.latencies) < HOST_MIN_SAMPLES:
+            return HTTP_READ_TIMEOUT
+        latencies = sorted(self.latencies)
+        p95 = latencies[int(len(latencies) * 0.95)]
+        return min(HTTP_READ_TIMEOUT,
+                   max(HOST_MIN_TIMEOUT, p95 * HOST_TIMEOUT_FACTOR))
+
+    def _set_state(self, state: int):
+        self.state = state
+        HOST_BREAKER_STATE.labels(self.host).set(state)
+
+    def _admit(self) -> bool:
+        """Raise if the breaker refuses a download, return whether the
+        download is the one probing a half open breaker."""
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < HOST_BREAKER_COOLDOWN:
+                HOST_REJECTED.labels(self.host).inc()
+                raise SourceUnavailable(f"{self.host} is failing")
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._probing:
+                HOST_REJECTED.labels(self.host).inc()
+                raise SourceUnavailable(f"{self.host} is failing")
+            self._probing = True
+            return True
+        return False
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        probe = self._admit()
+        self.active += 1
+        try:
+            async with self.semaphore:
+                yield
+        finally:
+            self.active -= 1
+            if probe:
+                self._probing = False
+
+    def succeeded(self, latency: float):
+        """The host answered, whatever the status, within ``latency``."""
+        self.latencies.append(latency)
+        HOST_LATENCY.labels(self.host).observe(latency)
+        self.failures = 0
+        if self.state != CLOSED:
+            self._set_state(CLOSED)
+
+    def failed(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or \
+                self.failures >= HOST_FAILURE_THRESHOLD:
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+    def forget(self):
+        for metric in (HOST_LATENCY, HOST_BREAKER_STATE, HOST_REJECTED):
+            with contextlib.suppress(KeyError):
+                metric.remove(self.host)
+
+
+class HostGuards:
+    """The guards of recently used hosts, idle ones beyond ``max_hosts``
+    are dropped along with their metrics."""
+
+    def __init__(self, max_hosts: int):
+        self.max_hosts = max_hosts
+        self._guards = OrderedDict()
+
+    def get(self, host: str) -> HostGuard:
+        guard = self._guards.get(host)
+        if guard is not None:
+            self._guards.move_to_end(host)
+            return guard
+        guard = self._guards[host] = HostGuard(host)
+        if len(self._guards) > self.max_hosts:
+            for name, old in list(self._guards.items())[:-1]:
+                if not old.active and old.state == CLOSED:
+                    del self._guards[name]
+                    old.forget()
+                    break
+        return guard
+
+
+host_guards = HostGuards(HOST_GUARD_MAX_HOSTS)
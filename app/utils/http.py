@@ -0,0 +1,97 @@
+import contextlib
+import os
+from typing import AsyncIterator, Optional
+
+import httpx
+from prometheus_client import Counter, Gauge
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 10))
+# how long a request may wait for a free connection from its pool
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", 5))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30))
+HTTP2 = os.getenv("HTTP2", "0").lower() in ("1", "true", "yes")
+ORIGIN_MAX_CONNECTIONS = int(os.getenv("ORIGIN_MAX_CONNECTIONS", 100))
+ORIGIN_MAX_KEEPALIVE = int(os.getenv("ORIGIN_MAX_KEEPALIVE", 20))
+BACKEND_MAX_CONNECTIONS = int(os.getenv("BACKEND_MAX_CONNECTIONS", 20))
+BACKEND_MAX_KEEPALIVE = int(os.getenv("BACKEND_MAX_KEEPALIVE", 10))
+
+HTTP_IN_FLIGHT = Gauge("dagpi_http_requests_in_flight",
+                       "Outgoing requests holding or waiting for a connection",
+                       ["client"])
+HTTP_MAX_CONNECTIONS = Gauge("dagpi_http_max_connections",
+                             "Connection limit of each outgoing client",
+                             ["client"])
+HTTP_POOL_TIMEOUTS = Counter("dagpi_http_pool_timeouts_total",
+                             "Requests that gave up waiting for a connection",
+                             ["client"])
+
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class HTTPClient:
+    """An ``httpx.AsyncClient`` with a connection pool of its own.
+
+    The client is created by :meth:`open`, or on first use, and closed
+    by :meth:`close`. Requests in flight are exported per client next to
+    the pool's connection limit, so saturation is their ratio.
+    """
+
+    def __init__(self, name: str, max_connections: int, max_keepalive: int,
+                 base_url: str = "", headers: Optional[dict] = None):
+        self.name = name
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY)
+        self.timeout = httpx.Timeout(HTTP_READ_TIMEOUT,
+                                     connect=HTTP_CONNECT_TIMEOUT,
+                                     pool=HTTP_POOL_TIMEOUT)
+        self.base_url = base_url
+        self.headers = headers
+        self._client = None
+        HTTP_MAX_CONNECTIONS.labels(name).set(max_connections)
+
+    def open(self) -> httpx.AsyncClient:
+        if self._client is None:
+            http2 = HTTP2 and http2_available()
+            if HTTP2 and not http2:
+                print(f"HTTP/2 requested for {self.name} requests but h2 is "
+                      f"not installed, using HTTP/1.1")
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url, headers=self.headers,
+                limits=self.limits, timeout=self.timeout, http2=http2)
+        return self._client
+
+    async def close(self):
+        client, self._client = self._client, None
+        if client is not None:
+            await client.aclose()
+
+    @contextlib.asynccontextmanager
+    async def _track(self):
+        HTTP_IN_FLIGHT.labels(self.name).inc()
+        try:
+            yield
+        except httpx.PoolTimeout:
+            HTTP_POOL_TIMEOUTS.labels(self.name).inc()
+            raise
+        finally:
+            HTTP_IN_FLIGHT.labels(self.name).dec()
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        async with self._track():
+            return await self.open().request(method, url, **kwargs)
+
+    @contextlib.asynccontextmanager
+    async def stream(self, method: str, url: str,
+                     **kwargs) -> AsyncIterator[httpx.Response]:
+        async with self._track():
+            async with self.open().stream(method, url, **kwargs) as response:
+                yield response
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List, Set
+
+from prometheus_client import Counter
+
+from .client import Client
+
+STAT_FLUSH_INTERVAL = float(os.getenv("STAT_FLUSH_INTERVAL", 5))
+STAT_BATCH_SIZE = int(os.getenv("STAT_BATCH_SIZE", 100))
+# records kept for a retry while the backend does not take them
+STAT_BUFFER_MAX = int(os.getenv("STAT_BUFFER_MAX", 10000))
+
+STATS_FLUSHED = Counter("dagpi_stats_flushed_total",
+                        "Stat records sent to the backend")
+STATS_DROPPED = Counter("dagpi_stats_dropped_total",
+                        "Stat records dropped after failed flushes")
+
+logger = logging.getLogger(__name__)
+
+
+class StatBuffer:
+    """Collects per request stats and posts them to the backend in bulk.
+
+    A flush happens every ``interval`` seconds, or as soon as
+    ``batch_size`` records are waiting. Records the backend does not
+    take are kept for the next flush, up to ``max_records``, and early
+    flushes wait until a flush succeeds again.
+
+    Every worker process buffers its own records, just as it keeps its
+    own ratelimit counts in :class:`~app.utils.auth_cache.AuthCache`, so
+    a token can exceed its limit up to the number of workers times over
+    between reconciliations.
+    """
+
+    def __init__(self, interval: float, batch_size: int, max_records: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_records = max_records
+        self._failing = False
+        self._records: List[Dict] = []
+        self._task = None
+        # flushes started by a full batch, kept until they finish
+        self._flushes: Set[asyncio.Future] = set()
+
+    def add(self, route: str, token: str, ua: str):
+        self._records.append({
+            "api": "image",
+            "route": route,
+            "token": token,
+            "user_agent": ua
+        })
+        if len(self._records) >= self.batch_size and not self._failing:
+            flush = asyncio.ensure_future(self.flush())
+            self._flushes.add(flush)
+            flush.add_done_callback(self._flushes.discard)
+
+    async def flush(self):
+        records, self._records = self._records, []
+        if not records:
+            return
+        try:
+            failed = await Client.post_stats(records)
+            if failed:
+                logger.warning("Backend did not take %d of %d stats",
+                               len(failed), len(records))
+        except Exception:
+            logger.exception("Unable to post %d stats", len(records))
+            failed = records
+        STATS_FLUSHED.inc(len(records) - len(failed))
+        self._failing = bool(failed)
+        if failed:
+            self._keep(failed)
+
+    def _keep(self, failed: List[Dict]):
+        # kept ahead of records added since, oldest dropped first
+        records = failed + self._records
+        dropped = len(records) - self.max_records
+        if dropped > 0:
+            STATS_DROPPED.inc(dropped)
+            logger.warning("Dropping %d stats the backend did not take",
+                           dropped)
+            records = records[dropped:]
+        self._records = records
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+        await self.flush()
+        if self._records:
+            STATS_DROPPED.inc(len(self._records))
+            logger.warning("Dropping %d stats not posted before shutdown",
+                           len(self._records))
+            self._records = []
+
+
+stat_buffer = StatBuffer(STAT_FLUSH_INTERVAL, STAT_BATCH_SIZE,
+                         STAT_BUFFER_MAX)
@@ -0,0 +1,68 @@
+"""Memory the template registry holds against the time it saves.
+
+For every registered template this decodes it from disk the way each
+request used to, and compares that with taking a copy from the
+preloaded registry::
+
+    python -m benchmarks.assets [--repeat 5]
+
+Run it from the repository root, with the app's dependencies installed.
+"""
+import argparse
+import resource
+import time
+
+import app.image.pil_manipulation  # noqa: F401, registers its templates
+from app.image.asset_registry import _image_bytes, assets
+
+
+def _frames(image):
+    return image if isinstance(image, tuple) else (image,)
+
+
+def _best(function, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def _rss_mb() -> float:
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    rss = _rss_mb()
+    started = time.perf_counter()
+    assets.preload()
+    startup = time.perf_counter() - started
+    rss = _rss_mb() - rss
+    print(f"{'asset':22s} {'held':>8s} {'decode':>9s} {'copy':>9s}")
+    held = decode = taken = 0.0
+    for key in assets._specs:
+        image = assets.shared(key)
+        size = sum(_image_bytes(frame) for frame in _frames(image))
+        # frame sets are only ever read, so handlers take them as they are
+        take = assets.shared if isinstance(image, tuple) else assets.get
+        decoding = _best(lambda: assets._decode(key), args.repeat)
+        taking = _best(lambda: take(key), args.repeat)
+        held += size
+        decode += decoding
+        taken += taking
+        print(f"{key:22s} {size / 2 ** 20:7.2f}M {decoding * 1000:7.2f}ms "
+              f"{taking * 1000:7.3f}ms")
+    count = len(assets._specs)
+    print(f"\n{count} assets: {held / 2 ** 20:.1f}MB of pixels held, "
+          f"peak RSS up {rss:.1f}MB, preloaded in {startup * 1000:.0f}ms")
+    print(f"a templated request saves {(decode - taken) / count * 1000:.1f}"
+          f"ms on average, {decode * 1000:.0f}ms over one use of each")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Output size and time of every animated route, against Pillow's writer.
+
+Each route runs on the same source image. The frames it hands to the GIF
+encoder are recorded and also saved with Pillow's own GIF writer, the way
+the routes wrote them before the shared encoder, so the two can be
+compared frame for frame::
+
+    python -m benchmarks.gif_sizes [image] [--routes triggered,shake]
+
+Run it from the repository root, with the app's dependencies installed.
+``GIF_PALETTE=shared`` measures the shared palette on the routes that
+leave the choice to that setting.
+"""
+import argparse
+import io
+import random
+import time
+from typing import Callable, Dict, List
+
+from PIL import Image
+
+from app.image import PILManip as pil_manip_module
+from app.image import gif_encoder, neon, pil_manipulation
+from app.image.asset_registry import assets
+
+DEFAULT_IMAGE = "app/image/assets/sithlord.jpg"
+
+
+class Recorder:
+    """Stands in for ``encode_gif`` and ``stream_gif`` to keep the frames
+    and timing each route encodes with."""
+
+    def __init__(self):
+        self.calls = []
+        self.seconds = 0.0
+
+    def encode_gif(self, frames, duration=None, loop=0, **kwargs):
+        frames = [frame.copy() for frame in frames]
+        self.calls.append((frames, duration, loop))
+        started = time.perf_counter()
+        try:
+            return gif_encoder.encode_gif(frames, duration=duration,
+                                          loop=loop, **kwargs)
+        finally:
+            self.seconds += time.perf_counter() - started
+
+    def stream_gif(self, frames, duration=0, loop=0, **kwargs):
+        # streamed frames may share one buffer that the route keeps drawing
+        # on, so each is copied as it is produced
+        frames = [frame.copy() for frame in frames]
+        self.calls.append((frames, duration, loop))
+        chunks = gif_encoder.stream_gif(iter(frames), duration=duration,
+                                        loop=loop, **kwargs)
+        while True:
+            started = time.perf_counter()
+            chunk = next(chunks, None)
+            self.seconds += time.perf_counter() - started
+            if chunk is None:
+                return
+            yield chunk
+
+    def __enter__(self):
+        self._saved = (pil_manip_module.encode_gif,
+                       pil_manipulation.encode_gif,
+                       pil_manipulation.stream_gif, neon.encode_gif)
+        pil_manip_module.encode_gif = self.encode_gif
+        pil_manipulation.encode_gif = self.encode_gif
+        pil_manipulation.stream_gif = self.stream_gif
+        neon.encode_gif = self.encode_gif
+        return self
+
+    def __exit__(self, *exc):
+        (pil_manip_module.encode_gif, pil_manipulation.encode_gif,
+         pil_manipulation.stream_gif, neon.encode_gif) = self._saved
+
+
+def pillow_gif(frames: List[Image.Image], duration, loop) -> bytes:
+    """The frames as Pillow's own writer saves them."""
+    io_ = io.BytesIO()
+    kwargs = {} if duration is None else {"duration": duration}
+    frames[0].save(io_, format="gif", save_all=True,
+                   append_images=frames[1:], loop=loop, **kwargs)
+    return io_.getvalue()
+
+
+def _body(result) -> bytes:
+    if isinstance(result, tuple):
+        result = result[0]
+    if isinstance(result, io.BytesIO):
+        return result.getvalue()
+    return b"".join(result)
+
+
+def routes(source: bytes, animated: bytes) -> Dict[str, Callable]:
+    raw = {name: getattr(pil_manipulation, name).__wrapped__
+           for name in ("triggered", "america", "communism", "shake",
+                        "spin_manip", "petpetgen", "bonk", "bomb",
+                        "quantize", "gen_dissolve", "invert", "jail",
+                        "wanted", "neon")}
+    # the neon route's defaults
+    neon = {"colors": [(244, 40, 43), (241, 196, 15), (56, 244, 120),
+                       (52, 152, 249), (180, 49, 182)],
+            "sharp": True, "soft": True, "overlay": False,
+            "direction": "left", "per_color": None,
+            "colors_per_frame": None}
+    return {
+        "triggered": lambda: raw["triggered"](source),
+        "america": lambda: raw["america"](source),
+        "communism": lambda: raw["communism"](source),
+        "shake": lambda: raw["shake"](source),
+        "spin": lambda: raw["spin_manip"](source),
+        "petpet": lambda: raw["petpetgen"](source),
+        "bonk": lambda: raw["bonk"](source),
+        "bomb": lambda: raw["bomb"](source),
+        "sketch": lambda: raw["quantize"](source),
+        "dissolve": lambda: raw["gen_dissolve"](source, False),
+        "pil (gif)": lambda: raw["invert"](animated),
+        "jail (gif)": lambda: raw["jail"](animated),
+        "wanted (gif)": lambda: raw["wanted"](animated),
+        "neon": lambda: raw["neon"](source, gradient=0, **neon),
+        "neon (grad)": lambda: raw["neon"](source, gradient=1, **neon),
+        "neon (gif)": lambda: raw["neon"](animated, multi=True, **neon),
+    }
+
+
+def animate(source: bytes) -> bytes:
+    """A 12 frame GIF of the source, for the routes that take one."""
+    img = Image.open(io.BytesIO(source)).convert("RGB")
+    img.thumbnail((400, 400))
+    frames = [img.rotate(angle * 10) for angle in range(12)]
+    io_ = io.BytesIO()
+    frames[0].save(io_, format="gif", save_all=True,
+                   append_images=frames[1:], duration=50, loop=0)
+    return io_.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("image", nargs="?", default=DEFAULT_IMAGE)
+    parser.add_argument("--routes", help="comma separated route names")
+    args = parser.parse_args()
+    with open(args.image, "rb") as f:
+        source = f.read()
+    assets.preload()
+    cases = routes(source, animate(source))
+    only = args.routes.split(",") if args.routes else cases
+    print(f"{'route':12s} {'encoder':>10s} {'pillow':>10s} {'ratio':>6s} "
+          f"{'enc ms':>8s} {'pillow ms':>9s}")
+    for name in only:
+        random.seed(0)
+        with Recorder() as recorder:
+            ours = len(_body(cases[name]()))
+        elapsed = recorder.seconds
+        theirs, pillow_elapsed = 0, 0.0
+        for frames, duration, loop in recorder.calls:
+            started = time.perf_counter()
+            theirs += len(pillow_gif(frames, duration, loop))
+            pillow_elapsed += time.perf_counter() - started
+        print(f"{name:12s} {ours / 1024:9.0f}K {theirs / 1024:9.0f}K "
+              f"{ours / theirs:6.2f} {elapsed * 1000:8.0f} "
+              f"{pillow_elapsed * 1000:9.0f}")
+
+
+if __name__ == "__main__":
+    main()
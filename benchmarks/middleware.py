@@ -0,0 +1,155 @@
+"""Per request overhead of the middleware stack, before and after.
+
+The same two endpoints, a two byte body and a 5MB GIF, are served bare,
+behind the ``BaseHTTPMiddleware`` stack the app used to have and behind
+the ASGI middleware it has now. Requests are driven straight through the
+ASGI interface, so the difference to the bare app is what the
+middleware costs::
+
+    python -m benchmarks.middleware [--requests 200]
+
+Run it from the repository root, with the app's dependencies installed.
+The token lookup and the stats upload are answered locally, so no
+backend is needed.
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from starlette.background import BackgroundTasks
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette_prometheus import PrometheusMiddleware as OldPrometheus
+
+from app.middleware import (AuthMiddleware, ProcessTimeMiddleware,
+                            PrometheusMiddleware)
+from app.utils.client import AuthModel, Client
+
+GIF_BYTES = 5 * 1024 * 1024
+TOKEN = "benchmark"
+
+
+async def _auth(_token: str) -> AuthModel:
+    return AuthModel({"auth": True, "ratelimited": False, "premium": False,
+                      "ratelimit": 10 ** 9, "left": 10 ** 9})
+
+
+async def _post(*_args, **_kwargs):
+    pass
+
+
+async def old_add_process_time_header(request: Request, call_next):
+    start_time = time.time()
+    response = await call_next(request)
+    process_time = time.time() - start_time
+    response.headers["X-Process-Time"] = str(process_time)
+    return response
+
+
+async def old_auth_check(request: Request, call_next):
+    """The dispatch the app used before, without its public paths."""
+    try:
+        token = request.headers["Authorization"]
+    except KeyError:
+        return JSONResponse({"message": "Unauthorized"}, status_code=403)
+    tok = await Client.auth(token)
+    if tok.auth and not tok.ratelimited:
+        response = await call_next(request)
+        response.headers["X-Ratelimit-Limit"] = str(tok.ratelimit)
+        response.headers['X-Ratelimit-Remaining'] = str(tok.left)
+        t = BackgroundTasks()
+        ua = request.headers.get("user-agent")
+        t.add_task(Client.post_stat, request.url.path, token, ua)
+        response.background = t
+        return response
+    return JSONResponse({"message": "Unauthorized"}, status_code=403)
+
+
+def build(stack: str) -> FastAPI:
+    app = FastAPI()
+    gif = b"GIF89a" + bytes(GIF_BYTES - 6)
+
+    @app.get("/trivial/")
+    async def trivial():
+        return Response(b"ok", media_type="text/plain")
+
+    @app.get("/gif/")
+    async def large_gif():
+        return Response(gif, media_type="image/gif")
+
+    # the order app.py adds them in
+    if stack == "before":
+        app.add_middleware(OldPrometheus)
+        app.add_middleware(BaseHTTPMiddleware,
+                           dispatch=old_add_process_time_header)
+        app.add_middleware(BaseHTTPMiddleware, dispatch=old_auth_check)
+    elif stack == "after":
+        app.add_middleware(PrometheusMiddleware)
+        app.add_middleware(ProcessTimeMiddleware)
+        app.add_middleware(AuthMiddleware)
+    return app
+
+
+async def request(app, path: str) -> int:
+    scope = {"type": "http", "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": path, "raw_path": path.encode(),
+             "root_path": "", "query_string": b"",
+             "headers": [(b"host", b"bench"),
+                         (b"authorization", TOKEN.encode()),
+                         (b"user-agent", b"benchmark")],
+             "client": ("127.0.0.1", 1), "server": ("bench", 80),
+             "app": app}
+    received = False
+    size = 0
+
+    async def receive():
+        nonlocal received
+        if received:
+            await asyncio.sleep(3600)
+            return {"type": "http.disconnect"}
+        received = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal size
+        if message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return size
+
+
+async def measure(app, path: str, requests: int) -> float:
+    for _ in range(max(1, requests // 10)):
+        await request(app, path)
+    started = time.perf_counter()
+    for _ in range(requests):
+        await request(app, path)
+    return (time.perf_counter() - started) / requests
+
+
+async def run(requests: int):
+    Client.auth = staticmethod(_auth)
+    Client.post_stat = staticmethod(_post)
+    Client.post_stats = staticmethod(_post)
+    print(f"{'endpoint':10s} {'stack':8s} {'ms/req':>8s} {'overhead':>9s}")
+    for path in ("/trivial/", "/gif/"):
+        bare = None
+        for stack in ("bare", "before", "after"):
+            seconds = await measure(build(stack), path, requests)
+            if bare is None:
+                bare = seconds
+            print(f"{path:10s} {stack:8s} {seconds * 1000:8.3f} "
+                  f"{(seconds - bare) * 1000:8.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Sending a 4K manipulation's output, copied into bytes or not.
+
+The output is sent through the ASGI interface many times, as
+``Response(img.read())`` did before and as :class:`ImageResponse` does
+now. The script reports responses per second and how much the process
+RSS grows while a response is being sent::
+
+    python -m benchmarks.responses [image] [--requests 50]
+
+An image is inverted and its output sent. Without one the output is a
+3840x2160 noise PNG, which compresses worst and so is the largest a 4K
+result gets. Run it from the repository root, with the app's
+dependencies installed. RSS is read from ``/proc``, so on other systems
+only throughput is reported.
+"""
+import argparse
+import asyncio
+import os
+import time
+from io import BytesIO
+
+import numpy as np
+from fastapi import Response
+from PIL import Image
+
+from app.image import pil_manipulation
+from app.routes.responses import ImageResponse
+
+SIZE_4K = (3840, 2160)
+
+
+def noise_png() -> bytes:
+    pixels = np.random.default_rng(0).integers(
+        0, 256, (SIZE_4K[1], SIZE_4K[0], 3), dtype=np.uint8)
+    io = BytesIO()
+    Image.fromarray(pixels, "RGB").save(io, format="png")
+    return io.getvalue()
+
+
+def rss() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def filled(output: bytes) -> BytesIO:
+    """A buffer written to the way a manipulation saves its output.
+
+    ``BytesIO(output)`` would share ``output`` until it is written to,
+    which makes ``read`` free and ``getbuffer`` copy, the opposite of
+    what happens to a manipulation's buffer.
+    """
+    img = BytesIO()
+    img.write(output)
+    img.seek(0)
+    return img
+
+
+def copied(img: BytesIO) -> Response:
+    return Response(img.read(), media_type="image/png")
+
+
+def zero_copy(img: BytesIO) -> Response:
+    return ImageResponse(img, media_type="image/png")
+
+
+async def send_one(respond, img: BytesIO) -> int:
+    """Send one response, returning how far RSS rose while sending it."""
+    baseline = rss()
+    grown = 0
+    scope = {"type": "http", "method": "GET", "path": "/",
+             "headers": []}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal grown
+        if message["type"] == "http.response.body":
+            grown = max(grown, rss() - baseline)
+
+    await respond(img)(scope, receive, send)
+    return grown
+
+
+async def run(output: bytes, requests: int):
+    print(f"output {len(output) / 2 ** 20:.1f}MB")
+    print(f"{'response':10s} {'per sec':>8s} {'RSS while sending':>18s}")
+    for name, respond in (("copied", copied), ("zero copy", zero_copy)):
+        await send_one(respond, filled(output))
+        grown = 0
+        elapsed = 0.0
+        for _ in range(requests):
+            # a fresh buffer, as each manipulation returns its own
+            img = filled(output)
+            started = time.perf_counter()
+            grown = max(grown, await send_one(respond, img))
+            elapsed += time.perf_counter() - started
+        print(f"{name:10s} {requests / elapsed:8.1f} "
+              f"{grown / 2 ** 20:16.1f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("image", nargs="?")
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+    if args.image:
+        with open(args.image, "rb") as f:
+            output, _image_format = pil_manipulation.invert.__wrapped__(
+                f.read())
+        output = output.getvalue()
+    else:
+        output = noise_png()
+    asyncio.run(run(output, args.requests))
+
+
+if __name__ == "__main__":
+    main()
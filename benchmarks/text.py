@@ -0,0 +1,87 @@
+"""Text routes with and without the font and measurement caches.
+
+Each route renders a tweet length text onto the same image. Without
+the caches every font is loaded from its file and every width measured
+again on each request; with them that work is shared between
+requests::
+
+    python -m benchmarks.text [image] [--repeat 5]
+
+Run it from the repository root, with the app's dependencies installed.
+"""
+import argparse
+import contextlib
+import sys
+import time
+
+from app.image import pil_manipulation, text_images, writetext
+
+DEFAULT_IMAGE = "app/image/assets/sithlord.jpg"
+TEXT = ("Benchmarks are only as honest as their inputs, so this one is "
+        "roughly the length of a full tweet, long enough to wrap over "
+        "several lines in every template.")
+CACHED = (writetext.get_font, writetext.text_size, writetext.layout_text)
+
+
+def routes(source: bytes):
+    raw = {name: getattr(module, name).__wrapped__
+           for module, name in ((text_images, "tweet_gen"),
+                                (text_images, "quote"),
+                                (text_images, "yt_comment"),
+                                (text_images, "motiv"),
+                                (text_images, "captcha"),
+                                (pil_manipulation, "memegen"))}
+    return {
+        "tweet": lambda: raw["tweet_gen"](source, "dagpi", TEXT),
+        "discord": lambda: raw["quote"](source, "dagpi", TEXT, True),
+        "yt": lambda: raw["yt_comment"](source, "dagpi", TEXT, True),
+        "motiv": lambda: raw["motiv"](source, TEXT[:60], TEXT[60:]),
+        "captcha": lambda: raw["captcha"](source, TEXT[:25]),
+        "modernmeme": lambda: raw["memegen"](source, TEXT),
+    }
+
+
+@contextlib.contextmanager
+def uncached():
+    """Every module's reference to a cached helper swapped for the
+    function underneath it."""
+    swapped = []
+    for module in list(sys.modules.values()):
+        if not getattr(module, "__name__", "").startswith("app."):
+            continue
+        for name, value in list(vars(module).items()):
+            if any(value is helper for helper in CACHED):
+                swapped.append((module, name, value))
+                setattr(module, name, value.__wrapped__)
+    try:
+        yield
+    finally:
+        for module, name, value in swapped:
+            setattr(module, name, value)
+
+
+def _mean(function, repeat: int) -> float:
+    function()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("image", nargs="?", default=DEFAULT_IMAGE)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    with open(args.image, "rb") as f:
+        cases = routes(f.read())
+    print(f"{'route':12s} {'no cache':>9s} {'cached':>9s}")
+    for name, case in cases.items():
+        with uncached():
+            before = _mean(case, args.repeat)
+        after = _mean(case, args.repeat)
+        print(f"{name:12s} {before * 1000:7.1f}ms {after * 1000:7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""The vectorized colour filters against the per pixel loops they replaced.
+
+The loops below are the original implementations, kept as the reference
+the numpy versions have to match pixel for pixel.
+"""
+import inspect
+import itertools
+import math
+
+import numpy as np
+import pytest
+from PIL import Image, ImageSequence
+
+from app.image import pil_manipulation
+
+ASSETS = "app/image/assets"
+# fixtures are shrunk so the reference loops stay quick
+FIXTURE_SIZE = (96, 96)
+
+
+def old_molten(img):
+    img = img.convert("RGB")
+    width, height = img.size
+    pix = img.load()
+    for w in range(width):
+        for h in range(height):
+            r, g, b = pix[w, h]
+            pix[w, h] = min(255, int(abs(r * 128 / (g + b + 1)))), \
+                min(255, int(abs(g * 128 / (b + r + 1)))), \
+                min(255, int(abs(b * 128 / (r + g + 1))))
+
+    return img
+
+
+def old_ice(img):
+    img = img.convert("RGB")
+    width, height = img.size
+    pix = img.load()
+    for w in range(width):
+        for h in range(height):
+            r, g, b = pix[w, h]
+            pix[w, h] = min(255, int(abs(r - g - b) * 3 / 2)), \
+                min(255, int(abs(g - b - r) * 3 / 2)), \
+                min(255, int(abs(b - r - g) * 3 / 2))
+
+    return img
+
+
+def old_earth(img):
+    img = img.convert("RGB")
+    width, height = img.size
+    pix = img.load()
+    for w in range(width):
+        for h in range(height):
+            r, g, b = pix[w, h]
+            pix[w, h] = int(math.sin(math.atan2(g, b)) * 255), \
+                int(math.sin(math.atan2(b, r)) * 255), \
+                int(math.sin(math.atan2(r, g)) * 255)
+
+    return img
+
+
+def old_comic_manip(img):
+    img = img.convert("RGB")
+    width, height = img.size
+    pix = img.load()
+    for w in range(width):
+        for h in range(height):
+            r, g, b = pix[w, h]
+            pix[w, h] = tuple(map(lambda i: min(255, i),
+                                  [
+                abs(g - b + g + r) * r // 256,
+                abs(b - g + b + r) * r // 256,
+                abs(b - g + b + r) * r // 256]))
+
+    return img.convert('L')
+
+
+FILTERS = {
+    "molten": old_molten,
+    "ice": old_ice,
+    "earth": old_earth,
+    "comic_manip": old_comic_manip,
+}
+
+
+def _still(name):
+    img = Image.open(f"{ASSETS}/{name}")
+    img.thumbnail(FIXTURE_SIZE)
+    return img
+
+
+def _gif_frames(name, count=3):
+    with Image.open(f"{ASSETS}/{name}") as img:
+        frames = [frame.copy() for frame in
+                  itertools.islice(ImageSequence.Iterator(img), count)]
+    for frame in frames:
+        frame.thumbnail(FIXTURE_SIZE)
+    return frames
+
+
+def _extremes():
+    """Every mix of the channel values where the formulas change course:
+    zero, full, and the neighbours of the overflow and sign boundaries."""
+    values = [0, 1, 2, 63, 64, 127, 128, 129, 170, 191, 254, 255]
+    pixels = list(itertools.product(values, repeat=3))
+    img = Image.new("RGB", (len(values) ** 2, len(values)))
+    img.putdata(pixels)
+    return img
+
+
+def _fixtures():
+    fixtures = [("sithlord.jpg", _still("sithlord.jpg")),
+                ("glass.png", _still("glass.png")),
+                ("triggered.png", _still("triggered.png")),
+                ("extremes", _extremes())]
+    for name in ("tenor.gif", "petpet.gif"):
+        fixtures += [(f"{name}[{index}]", frame)
+                     for index, frame in enumerate(_gif_frames(name))]
+    return fixtures
+
+
+FIXTURES = _fixtures()
+
+
+@pytest.mark.parametrize("fixture", FIXTURES, ids=[name for name, _img in
+                                                   FIXTURES])
+@pytest.mark.parametrize("name", list(FILTERS))
+def test_matches_per_pixel_loop(name, fixture):
+    _fixture_name, img = fixture
+    vectorized = inspect.unwrap(getattr(pil_manipulation, name))
+    expected = FILTERS[name](img.copy())
+    result = vectorized(img.copy())
+    assert result.mode == expected.mode
+    assert result.size == expected.size
+    assert np.array_equal(np.asarray(result), np.asarray(expected))
+
+
+def test_earth_lut_matches_math():
+    expected = [[int(math.sin(math.atan2(a, b)) * 255) for b in range(256)]
+                for a in range(256)]
+    assert np.array_equal(pil_manipulation._EARTH_LUT, expected)